@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Lightweight instrumentation for the pipeline:
+#   span("translate", slides=3)  times a stage, logs it as one JSON line,
+#                                adds it to the per-stage histogram and to the
+#                                current trace (used by debug_app's waterfall)
+#   count("cache_hits")          increments a counter
+#   register_stats("cache", d)   exports a module's existing *_STATS dict
+#   prometheus_text()            all of the above in Prometheus text format
+
+logger = logging.getLogger("translator")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get("TRANSLATOR_LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_counters = {}
+_histograms = {}
+_stats = {}
+_lock = threading.Lock()
+_trace = contextvars.ContextVar("trace", default=None)
+
+################################################
+#structured logs
+################################################
+
+def log_event(event, level=logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps(dict(fields, event=event, ts=round(time.time(), 3)), ensure_ascii=False, default=str))
+
+################################################
+#counters, histograms, spans
+################################################
+
+def count(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    with _lock:
+        histogram = _histograms.setdefault(name, {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)})
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+
+
+def register_stats(prefix, stats):
+    """Export an existing *_STATS dict (cache hits, batches...) on the metrics endpoint."""
+    with _lock:
+        _stats[prefix] = stats
+
+
+def start_trace():
+    """Begin collecting spans for the current request; returns the span list."""
+    spans = []
+    _trace.set({"start": time.perf_counter(), "spans": spans})
+    return spans
+
+
+def current_trace():
+    trace = _trace.get()
+    return trace["spans"] if trace else None
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a pipeline stage. attrs can be extended inside the block (token counts...)."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds)
+        trace = _trace.get()
+        if trace is not None:
+            trace["spans"].append({
+                "name": name,
+                "offset": start - trace["start"],
+                "seconds": seconds,
+                **attrs,
+            })
+        fields = dict(attrs, seconds=round(seconds, 4))
+        if error is not None:
+            fields["error"] = str(error)
+        log_event(f"span.{name}", **fields)
+
+
+def timed(name):
+    """Decorator form of span() for functions with several return points."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+################################################
+#Prometheus text endpoint
+################################################
+
+def _metric_name(name):
+    return "translator_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text():
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            metric = _metric_name(name) + "_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, histogram in sorted(_histograms.items()):
+            metric = _metric_name(name) + "_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            # observe() already counts a value in every bucket it fits, so these are cumulative
+            for bound, bucket in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {bucket}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram["count"]}')
+            lines.append(f"{metric}_sum {histogram['sum']}")
+            lines.append(f"{metric}_count {histogram['count']}")
+        for prefix, stats in sorted(_stats.items()):
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = _metric_name(f"{prefix}_{key}")
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """Serve /metrics on a background thread; port defaults to TRANSLATOR_METRICS_PORT (off if unset)."""
+    global _metrics_server
+    port = port or os.environ.get("TRANSLATOR_METRICS_PORT")
+    if not port or _metrics_server is not None:
+        return _metrics_server
+    _metrics_server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics", daemon=True).start()
+    log_event("metrics.listening", host=host, port=int(port))
+    return _metrics_server
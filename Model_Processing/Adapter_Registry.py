@@ -0,0 +1,43 @@
+import os
+
+# The LoRA adapters a request can choose from (name -> path). All of them
+# sit on one resident base model; see Model_Using.use_adapter. More can be
+# added without editing code: TRANSLATOR_ADAPTERS="0.5B_d2=C:\...\0.5B_d2;other=..."
+# Kept free of torch imports so app.py can list the names cheaply.
+ADAPTERS = {
+    "0.5B_d1": r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1",
+}
+# The system prompt each adapter was trained with: "full" (the multi-rule
+# Model_Using.system_instruction, the default) or "compact" (the one-line
+# prompt of Lora_Finetune.ipynb's compact run), e.g. "0.5B_compact=C:\...|compact"
+PROMPT_MODES = {}
+for _entry in os.environ.get("TRANSLATOR_ADAPTERS", "").split(";"):
+    if "=" in _entry:
+        _name, _path = _entry.split("=", 1)
+        _path, _, _mode = _path.partition("|")
+        ADAPTERS[_name.strip()] = _path.strip()
+        if _mode.strip():
+            PROMPT_MODES[_name.strip()] = _mode.strip()
+
+DEFAULT_ADAPTER = os.environ.get("TRANSLATOR_DEFAULT_ADAPTER", "0.5B_d1")
+# At most this many adapters stay loaded; the least recently used is dropped
+MAX_RESIDENT_ADAPTERS = int(os.environ.get("TRANSLATOR_MAX_ADAPTERS", "3"))
+
+
+def adapter_names():
+    return list(ADAPTERS)
+
+
+def adapter_path(name):
+    """Path of adapter name (None = the default); raises KeyError for unknown names."""
+    return ADAPTERS[name or DEFAULT_ADAPTER]
+
+
+def prompt_mode(name):
+    """"full" or "compact" for adapter name (None = the default)."""
+    return PROMPT_MODES.get(name or DEFAULT_ADAPTER, "full")
+
+
+def is_multi_adapter():
+    # With a single adapter it is merged into the base weights instead
+    return len(ADAPTERS) > 1
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Builds the fine-tuning targets: every English sample is sent to the teacher
+# model and its {"translated", "explaining"} answer is appended to a JSONL
+# checkpoint as soon as it arrives. A few requests run at once, limited only
+# by the teacher's rate limit; a rerun skips the samples already in the file.
+
+TEACHER_MODEL = "gemini-2.5-pro"
+REQUESTS_PER_MINUTE = float(os.environ.get("DISTILL_RPM", "14"))
+CONCURRENCY = int(os.environ.get("DISTILL_CONCURRENCY", "4"))
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+
+sample_data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "full_json2.json")
+
+
+def build_prompt(system_instruction, source_text):
+    # Same prompt as the notebook's original loop
+    return f"{system_instruction}\n\nInput: \"{source_text}\""
+
+
+def sample_key(source_text):
+    return hashlib.sha256(source_text.encode("utf-8")).hexdigest()
+
+################################################
+#teachers: anything with `async generate(prompt) -> str`
+################################################
+
+class GeminiTeacher:
+
+    def __init__(self, api_key=None, model=TEACHER_MODEL, temperature=0.2):
+        from google import genai
+        from google.genai import types
+        self.client = genai.Client(api_key=api_key or os.environ.get("G_KEY"))
+        self.model = model
+        self.config = types.GenerateContentConfig(response_mime_type="application/json", temperature=temperature)
+
+    async def generate(self, prompt):
+        response = await self.client.aio.models.generate_content(model=self.model, contents=prompt, config=self.config)
+        return response.text.strip()
+
+
+class HttpTeacher:
+    """POSTs {"prompt": ...} to url and reads {"text": ...}; see serve_stand_in."""
+
+    def __init__(self, url, timeout=120):
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, prompt):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"prompt": prompt}, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))["text"]
+
+    async def generate(self, prompt):
+        return await asyncio.to_thread(self._post, prompt)
+
+################################################
+#rate limiting and retries
+################################################
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_target(text):
+    target = json.loads(text)
+    if not isinstance(target, dict) or "translated" not in target:
+        raise ValueError("teacher answer is not a {translated, explaining} object")
+    return target
+
+
+async def _distill_one(teacher, bucket, prompt, max_retries):
+    # Rate-limit errors, network errors and unusable answers are all retried
+    # with exponential backoff and jitter
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            return parse_target(await teacher.generate(prompt))
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt) * (0.5 + random.random())
+            print(f"Retrying in {delay:.1f}s after: {e}")
+            await asyncio.sleep(delay)
+
+################################################
+#checkpoint
+################################################
+
+def read_checkpoint(out_jsonl):
+    """Keys of the samples already distilled; a torn last line is cut off."""
+    done = set()
+    if not os.path.exists(out_jsonl):
+        return done
+    good_offset = 0
+    with open(out_jsonl, 'rb') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["key"])
+            except (json.JSONDecodeError, KeyError, UnicodeDecodeError):
+                break
+            good_offset += len(line)
+    with open(out_jsonl, 'r+b') as f:
+        f.truncate(good_offset)
+    return done
+
+
+def export_dataset(out_jsonl, output_json_path):
+    """Write the checkpoint as the JSON list the notebook's formatting step reads."""
+    with open(out_jsonl, 'r', encoding='utf-8') as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    for sample in samples:
+        sample.pop("key", None)
+    with open(output_json_path, 'w', encoding='utf-8') as f:
+        json.dump(samples, f, ensure_ascii=False, indent=4)
+    return len(samples)
+
+################################################
+#distillation
+################################################
+
+async def distill(samples, out_jsonl, teacher, system_instruction,
+                  concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE, max_retries=MAX_RETRIES):
+    """Distill every sample not yet in out_jsonl; returns (written, failed).
+
+    Await it from a notebook, or use run_distillation from a script.
+    """
+    done = read_checkpoint(out_jsonl)
+    todo = []
+    for sample in samples:
+        # Repeated source texts are sent once
+        key = sample_key(sample["en"])
+        if key not in done:
+            done.add(key)
+            todo.append(sample)
+    print(f"{len(samples) - len(todo)} samples already distilled or repeated, {len(todo)} to go")
+
+    bucket = TokenBucket(requests_per_minute / 60.0, capacity=max(1, concurrency))
+    queue = asyncio.Queue()
+    for sample in todo:
+        queue.put_nowait(sample)
+    stats = {"written": 0, "failed": 0}
+    start = time.perf_counter()
+
+    with open(out_jsonl, 'a', encoding='utf-8') as out:
+
+        async def worker():
+            while True:
+                try:
+                    sample = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    target = await _distill_one(teacher, bucket, build_prompt(system_instruction, sample["en"]), max_retries)
+                except Exception as e:
+                    # Left out of the checkpoint, so the next run tries again
+                    stats["failed"] += 1
+                    print(f"Error processing sample: {e}")
+                    continue
+                record = dict(sample, target=target, key=sample_key(sample["en"]))
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                stats["written"] += 1
+                if stats["written"] % 25 == 0:
+                    print(f"{stats['written']} data samples have been handled ({time.perf_counter() - start:.0f}s)")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    print(f"Distillation complete: {stats['written']} written, {stats['failed']} failed "
+          f"in {time.perf_counter() - start:.1f}s")
+    return stats["written"], stats["failed"]
+
+
+def run_distillation(*args, **kwargs):
+    return asyncio.run(distill(*args, **kwargs))
+
+################################################
+#local stand-in teacher (tests, dry runs)
+################################################
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    failure_rate = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        prompt = json.loads(self.rfile.read(length).decode("utf-8"))["prompt"]
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.send_response(429)
+            self.end_headers()
+            return
+        source = prompt.rsplit("Input: ", 1)[-1].strip('"')
+        answer = {
+            "translated": '<div dir="rtl">' + "<br>".join(source.split("\n")) + '</div>',
+            "explaining": "",
+        }
+        body = json.dumps({"text": json.dumps(answer, ensure_ascii=False)}, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stand_in(host="127.0.0.1", port=8799, latency=0.5, failure_rate=0.1, background=False):
+    """Echo teacher with latency and random 429s, for exercising the pool offline."""
+    handler = type("StandInHandler", (_StandInHandler,), {"latency": latency, "failure_rate": failure_rate})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Stand-in teacher on http://{host}:{server.server_port}")
+    if background:
+        threading.Thread(target=server.serve_forever, name="stand-in-teacher", daemon=True).start()
+        return server
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill teacher translations into a resumable JSONL checkpoint")
+    parser.add_argument("--input", default=sample_data_path, help="JSON list of {\"en\": ...} samples")
+    parser.add_argument("--out", default="distilled.jsonl", help="append-only checkpoint")
+    parser.add_argument("--export", help="also write the finished dataset as a JSON list here")
+    parser.add_argument("--teacher", choices=["gemini", "http"], default="gemini")
+    parser.add_argument("--url", default="http://127.0.0.1:8799", help="endpoint for --teacher http")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="teacher requests per minute")
+    parser.add_argument("--limit", type=int, help="only the first N samples")
+    parser.add_argument("--stand-in", action="store_true", help="run the local stand-in teacher instead")
+    args = parser.parse_args()
+
+    if args.stand_in:
+        serve_stand_in()
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            data = json.load(f)[:args.limit]
+        from Model_Processing.Model_Using import system_instruction
+        teacher = GeminiTeacher() if args.teacher == "gemini" else HttpTeacher(args.url)
+        run_distillation(data, args.out, teacher, system_instruction,
+                         concurrency=args.concurrency, requests_per_minute=args.rpm)
+        if args.export:
+            print(f"{export_dataset(args.out, args.export)} samples written to {args.export}")
@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+from collections import Counter, deque
+from Model_Processing.Response_utils import split_explaining, merge_explaining, term_of
+
+# Term -> Arabic explanation index. Built offline from the teacher targets of
+# the distillation data and from the terms the translation memory has seen;
+# at inference time the known terms of a slide are found in one pass
+# (Aho-Corasick), their explanations are filled in directly and the model is
+# only asked to explain the others.
+GLOSSARY_PATH = os.environ.get("TRANSLATOR_GLOSSARY_PATH", os.path.join("cache", "glossary.json"))
+ENABLED = os.environ.get("TRANSLATOR_GLOSSARY", "1") != "0"
+# Longer "terms" are usually a sentence that lost its colon
+MAX_TERM_WORDS = 6
+# At most this many known terms are listed in the prompt
+MAX_PROMPT_TERMS = 40
+
+GLOSSARY_STATS = {"terms": 0, "slides": 0, "terms_filled": 0}
+
+_index = None
+_lock = threading.Lock()
+
+################################################
+#multi-pattern matcher (Aho-Corasick)
+################################################
+
+def _is_word(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class TermMatcher:
+    """Finds every lowercased term that occurs in a text as a whole word, in one pass."""
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for term in terms:
+            node = 0
+            for ch in term:
+                child = self.goto[node].get(ch)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][ch] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = child
+            self.out[node].append(term)
+
+        # Failure links, breadth first: the longest proper suffix that is also a prefix
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def find(self, text):
+        """Distinct terms in order of appearance; overlapping matches keep the longest."""
+        lowered = text.lower()
+        matches = []
+        node = 0
+        for end, ch in enumerate(lowered, 1):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for term in self.out[node]:
+                start = end - len(term)
+                # Same rule as Translation_Memory.explaining_for: (?<!\w)term(?!\w)
+                if (start == 0 or not _is_word(lowered[start - 1])) and (end == len(lowered) or not _is_word(lowered[end])):
+                    matches.append((start, end, term))
+
+        found = []
+        covered = 0
+        for start, end, term in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+            if start >= covered:
+                covered = end
+                if term not in found:
+                    found.append(term)
+        return found
+
+################################################
+#building the index
+################################################
+
+def _targets_of(path):
+    # A distillation checkpoint (JSONL) or an exported / training JSON list
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(".jsonl"):
+            samples = [json.loads(line) for line in f if line.strip()]
+        else:
+            samples = json.load(f)
+    for sample in samples:
+        target = sample.get("target") if isinstance(sample, dict) else None
+        if isinstance(target, dict):
+            yield target
+
+
+def _usable(term):
+    return len(term) > 1 and len(term.split()) <= MAX_TERM_WORDS
+
+
+def build_glossary(sources=(), include_memory=True, output_path=GLOSSARY_PATH):
+    """Write {term: explanation block} to output_path; returns the number of terms.
+
+    sources are distillation outputs with {"target": {"translated", "explaining"}};
+    the most frequent explanation of a term wins, ties go to the teacher.
+    """
+    blocks = {}
+    for path in sources:
+        for target in _targets_of(path):
+            for term, block in split_explaining(target.get("explaining", "")):
+                if _usable(term):
+                    blocks.setdefault(term.lower(), Counter())[block] += 1
+    teacher_terms = len(blocks)
+    if include_memory:
+        from Model_Processing import Translation_Memory
+        for term, block in Translation_Memory.all_terms():
+            if _usable(term):
+                blocks.setdefault(term.lower(), Counter())[block] += 1
+
+    # most_common keeps insertion order between equal counts
+    glossary = {term: counter.most_common(1)[0][0] for term, counter in sorted(blocks.items())}
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(glossary, f, ensure_ascii=False, indent=1)
+    print(f"Glossary: {len(glossary)} terms ({teacher_terms} from the teacher data) written to {output_path}")
+    return len(glossary)
+
+################################################
+#lookup
+################################################
+
+def _load():
+    # Reloaded when build_glossary rewrites the file
+    global _index
+    try:
+        mtime = os.path.getmtime(GLOSSARY_PATH)
+    except OSError:
+        mtime = None
+    with _lock:
+        if _index is None or _index["path"] != GLOSSARY_PATH or _index["mtime"] != mtime:
+            blocks, version = {}, ""
+            if mtime is not None:
+                with open(GLOSSARY_PATH, 'rb') as f:
+                    raw = f.read()
+                blocks = json.loads(raw.decode("utf-8"))
+                version = hashlib.sha256(raw).hexdigest()[:16]
+            _index = {"path": GLOSSARY_PATH, "mtime": mtime, "blocks": blocks,
+                      "version": version, "matcher": TermMatcher(blocks)}
+            GLOSSARY_STATS["terms"] = len(blocks)
+        return _index
+
+
+def version():
+    """Changes whenever the glossary does; part of the translation cache key."""
+    return _load()["version"] if ENABLED else ""
+
+
+def lookup(text):
+    """{term: explanation block} for the glossary terms in text, in order of appearance."""
+    if not ENABLED or not text:
+        return {}
+    index = _load()
+    return {term: index["blocks"][term] for term in index["matcher"].find(text)}
+
+
+def prompt_note(text):
+    """Instruction listing the terms of text that need no explanation, or None."""
+    known = lookup(text)
+    if not known:
+        return None
+    terms = [term_of(block) for block in known.values()][:MAX_PROMPT_TERMS]
+    return ("These terms are already explained elsewhere; do NOT include them in \"explaining\": "
+            + ", ".join(terms))
+
+
+def fill_explaining(result_text, text):
+    """Add the glossary explanations of the terms in text to a parsed result."""
+    known = lookup(text)
+    if not known:
+        return result_text
+    GLOSSARY_STATS["slides"] += 1
+    GLOSSARY_STATS["terms_filled"] += len(known)
+    # Glossary blocks come first, so a term the model explained anyway keeps one definition
+    return dict(result_text, explaining=merge_explaining("".join(known.values()), result_text.get("explaining", "")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the term glossary from distillation outputs and the translation memory")
+    parser.add_argument("sources", nargs="*", help="distillation checkpoints (.jsonl) or exported datasets (.json)")
+    parser.add_argument("--out", default=GLOSSARY_PATH)
+    parser.add_argument("--no-memory", action="store_true", help="leave out the translation memory terms")
+    args = parser.parse_args()
+    build_glossary(args.sources, include_memory=not args.no_memory, output_path=args.out)
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from Model_Processing import Model_Using
+from Model_Processing.Model_Using import translate_batch, warm_up
+from Metrics_utils import register_stats, prometheus_text
+
+# One process holds the model; every front end posts slides here instead of
+# loading its own copy (set TRANSLATOR_SERVER_URL on the clients).
+# Requests that arrive within MAX_WAIT_MS of each other are translated
+# together, up to MAX_BATCH_SIZE slides per generate() call.
+MAX_BATCH_SIZE = int(os.environ.get("TRANSLATOR_SERVER_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.environ.get("TRANSLATOR_SERVER_MAX_WAIT_MS", "20"))
+
+SERVER_STATS = {"requests": 0, "batches": 0, "largest_batch": 0}
+register_stats("server", SERVER_STATS)
+
+_requests = queue.Queue()
+
+
+def _batch_loop(max_batch_size, max_wait_ms):
+    while True:
+        batch = [_requests.get()]
+        deadline = time.perf_counter() + max_wait_ms / 1000.0
+        while len(batch) < max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        SERVER_STATS["batches"] += 1
+        SERVER_STATS["largest_batch"] = max(SERVER_STATS["largest_batch"], len(batch))
+        try:
+            results = translate_batch([data for data, _ in batch], batch_size=max_batch_size)
+        except Exception as e:
+            results = [f"Error: Generation failed: {e}"] * len(batch)
+        for (_, future), html in zip(batch, results):
+            future.set_result(html)
+
+
+def submit(data_input):
+    """Queue one slide for the next batch; returns a Future with its HTML."""
+    future = Future()
+    SERVER_STATS["requests"] += 1
+    _requests.put((data_input, future))
+    return future
+
+
+class TranslateHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, dict(SERVER_STATS, status="ok", queued=_requests.qsize()))
+        elif self.path == "/metrics":
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            self._send_json(400, {"error": "Invalid JSON body"})
+            return
+        self._send_json(200, {"html": submit(data).result()})
+
+    def log_message(self, format, *args):
+        # Keep the console for the model's own messages
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    # The server translates locally even if TRANSLATOR_SERVER_URL is set in its environment
+    Model_Using.SERVER_URL = None
+    warm_up(background=False)
+    threading.Thread(target=_batch_loop, args=(max_batch_size, max_wait_ms), name="batcher", daemon=True).start()
+    server = ThreadingHTTPServer((host, port), TranslateHandler)
+    print(f"Inference server on http://{host}:{port} (batch <= {max_batch_size}, wait <= {max_wait_ms}ms)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve translate_and_generate_html over HTTP with dynamic batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.max_batch_size, args.max_wait_ms)
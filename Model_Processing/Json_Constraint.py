@@ -0,0 +1,173 @@
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+# Constrained decoding for the {"translated": "...", "explaining": "..."}
+# answer. A small byte-level automaton walks the fixed key layout and the two
+# JSON strings; at every step only tokens that keep the output valid may be
+# chosen, and generation stops as soon as the closing "}" is written, so no
+# code fences or trailing text are ever generated.
+
+_STRING = None
+_SCHEMA = [b'{', b'"translated"', b':', _STRING, b',', b'"explaining"', b':', _STRING, b'}']
+_WHITESPACE = b' \t\n\r'
+_ESCAPES = b'"\\/bfnrt'
+_HEX = b'0123456789abcdefABCDEF'
+
+# Whitespace is legal between any two JSON tokens; without a limit a model
+# can keep choosing newlines forever. Pretty-printed output needs only a few.
+MAX_WHITESPACE = 8
+
+# state = (segment index, offset inside the segment, counter)
+#   for a string segment: offset 0 = before the opening quote, 1 = inside
+#   counter inside a string: 0 normal, 1 after a backslash, 2..5 hex digits of \uXXXX left + 1
+#   counter between tokens: whitespace bytes written since the last token
+START = (0, 0, 0)
+DONE = (len(_SCHEMA), 0, 0)
+
+
+def advance(state, data):
+    """Feed bytes to the automaton; returns the new state or None if invalid."""
+    segment, offset, escape = state
+    for byte in data:
+        if segment == len(_SCHEMA):
+            return None
+        expected = _SCHEMA[segment]
+
+        if expected is _STRING:
+            if offset == 0:
+                if byte == ord('"'):
+                    offset, escape = 1, 0
+                elif byte in _WHITESPACE and escape < MAX_WHITESPACE:
+                    escape += 1
+                else:
+                    return None
+            elif escape == 1:
+                if byte == ord('u'):
+                    escape = 5
+                elif byte in _ESCAPES:
+                    escape = 0
+                else:
+                    return None
+            elif escape > 1:
+                if byte not in _HEX:
+                    return None
+                escape = 0 if escape == 2 else escape - 1
+            elif byte == ord('\\'):
+                escape = 1
+            elif byte == ord('"'):
+                segment, offset = segment + 1, 0
+            elif byte < 0x20:
+                # raw control characters are not allowed inside JSON strings
+                return None
+            continue
+
+        if offset == 0 and byte in _WHITESPACE:
+            if escape >= MAX_WHITESPACE:
+                return None
+            escape += 1
+            continue
+        if byte != expected[offset]:
+            return None
+        offset, escape = offset + 1, 0
+        if offset == len(expected):
+            segment, offset = segment + 1, 0
+    return (segment, offset, escape)
+
+
+def _bytes_to_unicode():
+    # The byte <-> printable character map used by byte-level BPE (GPT-2, Qwen)
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, (chr(c) for c in cs)))
+
+
+_token_bytes_cache = {}
+
+
+def token_bytes_table(tokenizer):
+    """bytes for every token id; None for special tokens, which are never allowed."""
+    key = id(tokenizer)
+    if key not in _token_bytes_cache:
+        byte_decoder = {c: b for b, c in _bytes_to_unicode().items()}
+        special = set(tokenizer.all_special_ids) | set(getattr(tokenizer, "added_tokens_decoder", {}) or {})
+        table = []
+        for token_id, token in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+            if token is None or token_id in special:
+                table.append(None)
+                continue
+            try:
+                table.append(bytes(byte_decoder[c] for c in token))
+            except KeyError:
+                table.append(token.encode("utf-8"))
+        _token_bytes_cache[key] = table
+    return _token_bytes_cache[key]
+
+
+class JsonSchemaLogitsProcessor(LogitsProcessor):
+    """Greedy-compatible constraint: keeps only the best-scoring valid token per row."""
+
+    def __init__(self, tokenizer, eos_token_id, top_k=64):
+        self.table = token_bytes_table(tokenizer)
+        self.eos_token_id = eos_token_id
+        self.top_k = top_k
+        self.states = None
+        self.seen = None
+
+    def sync(self, input_ids):
+        # The first call sees only the prompt; later calls catch up on the
+        # tokens appended since the previous call
+        if self.states is None:
+            self.states = [START] * input_ids.shape[0]
+            self.seen = input_ids.shape[1]
+            return
+        for row in range(input_ids.shape[0]):
+            state = self.states[row]
+            for token_id in input_ids[row, self.seen:].tolist():
+                if state is None or state == DONE:
+                    break
+                data = self.table[token_id] if token_id < len(self.table) else None
+                state = advance(state, data) if data is not None else None
+            self.states[row] = state
+        self.seen = input_ids.shape[1]
+
+    def done(self):
+        return [state is None or state == DONE for state in self.states]
+
+    def _best_valid(self, row_scores, state):
+        # The best valid token is almost always among the top few; only sort
+        # the whole vocabulary when it is not
+        k = min(self.top_k, row_scores.shape[-1])
+        for candidates in (torch.topk(row_scores, k).indices, torch.argsort(row_scores, descending=True)[k:]):
+            for token_id in candidates.tolist():
+                data = self.table[token_id] if token_id < len(self.table) else None
+                if data and advance(state, data) is not None:
+                    return token_id
+        return self.eos_token_id
+
+    def __call__(self, input_ids, scores):
+        self.sync(input_ids)
+        masked = torch.full_like(scores, float("-inf"))
+        for row, state in enumerate(self.states):
+            if state is None or state == DONE:
+                token_id = self.eos_token_id
+            else:
+                token_id = self._best_valid(scores[row], state)
+            masked[row, token_id] = scores[row, token_id] if torch.isfinite(scores[row, token_id]) else 0.0
+        return masked
+
+
+class JsonDoneStoppingCriteria(StoppingCriteria):
+    """Stops each row as soon as its top-level object is closed."""
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.processor.sync(input_ids)
+        return torch.tensor(self.processor.done(), dtype=torch.bool, device=input_ids.device)
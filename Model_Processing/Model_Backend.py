@@ -0,0 +1,268 @@
+import os
+import time
+import argparse
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from peft import PeftModel
+
+# "auto" picks cuda when a GPU is visible, otherwise cpu
+DEVICE_PREFERENCE = os.environ.get("TRANSLATOR_DEVICE", "auto")
+# CPU fast path: "int8" (dynamic quantization), "bf16" or "fp32"
+CPU_PRECISION = os.environ.get("TRANSLATOR_CPU_PRECISION", "int8")
+CPU_THREADS = int(os.environ.get("TRANSLATOR_CPU_THREADS", "0"))
+# "torch", or "onnx" for ONNX Runtime on an export made by `Model_Saved.py --onnx`
+BACKEND = os.environ.get("TRANSLATOR_BACKEND", "torch").lower()
+
+################################################
+#device selection
+################################################
+
+def select_device(preference=DEVICE_PREFERENCE):
+    preference = (preference or "auto").lower()
+    if preference == "cuda" and not torch.cuda.is_available():
+        print("WARNING: cuda requested but no GPU is available, falling back to cpu")
+        return "cpu"
+    if preference in ("cuda", "cpu"):
+        return preference
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def cpu_supports_bf16():
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def resolve_cpu_precision(precision=CPU_PRECISION):
+    precision = (precision or "int8").lower()
+    if precision == "bf16" and not cpu_supports_bf16():
+        print("WARNING: this CPU has no native bf16 support, using fp32")
+        return "fp32"
+    if precision not in ("int8", "bf16", "fp32"):
+        return "fp32"
+    return precision
+
+
+def configure_cpu_threads(threads=CPU_THREADS):
+    # One intra-op pool sized to the machine; inter-op parallelism only adds
+    # contention for a single generate() call.
+    threads = threads or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once, before any parallel work has started
+        pass
+    return threads
+
+################################################
+#model preparation
+################################################
+
+def load_dtype(device, precision=CPU_PRECISION):
+    if device == "cuda":
+        return torch.float16
+    if resolve_cpu_precision(precision) == "bf16":
+        return torch.bfloat16
+    # int8 quantization starts from fp32 weights
+    return torch.float32
+
+
+def prepare_model_for_device(model, device, precision=CPU_PRECISION, keep_adapters=False):
+    """Move a (PEFT) model to its device and apply the CPU fast path.
+
+    On cpu the LoRA weights are merged into the base projections first, so the
+    int8 quantization covers the fused Linear layers and no extra adapter
+    matmuls are left in the forward pass. keep_adapters leaves the PEFT
+    wrapper in place so adapters can still be swapped; int8 then falls back
+    to fp32, since LoRA layers cannot be added onto quantized Linear layers.
+    """
+    if device == "cuda":
+        return model.to("cuda")
+
+    configure_cpu_threads()
+    precision = resolve_cpu_precision(precision)
+
+    if isinstance(model, PeftModel) and not keep_adapters:
+        model = model.merge_and_unload()
+    elif keep_adapters and precision == "int8":
+        print("WARNING: int8 is not used with swappable adapters, using fp32")
+        precision = "fp32"
+
+    if precision == "int8":
+        model = torch.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16)
+    else:
+        model = model.float()
+    return model.to("cpu")
+
+################################################
+#ONNX Runtime backend (TRANSLATOR_BACKEND=onnx)
+################################################
+
+class OnnxCausalLM:
+    """Greedy generate() over a model exported by `Model_Saved.py --onnx`.
+
+    Takes and returns torch tensors like transformers' generate(), and runs
+    the same logits processors, stopping criteria and streamer, so
+    Model_Using can swap it in for the PyTorch model. Only greedy decoding
+    is supported, which is all the translator uses.
+    """
+
+    def __init__(self, model_dir, file_name=None, threads=CPU_THREADS):
+        import onnxruntime
+        from transformers import AutoConfig, GenerationConfig
+
+        if file_name is None:
+            # The int8 file is preferred when the export produced one
+            file_name = "model_int8.onnx" if os.path.exists(os.path.join(model_dir, "model_int8.onnx")) else "model.onnx"
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, file_name), options, providers=["CPUExecutionProvider"])
+        self.file_name = file_name
+
+        self.config = AutoConfig.from_pretrained(model_dir)
+        try:
+            self.generation_config = GenerationConfig.from_pretrained(model_dir)
+        except OSError:
+            self.generation_config = GenerationConfig.from_model_config(self.config)
+        self.past_names = [i.name for i in self.session.get_inputs() if i.name.startswith("past_key_values.")]
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+
+    def eval(self):
+        return self
+
+    def _empty_past(self, batch):
+        import numpy as np
+        heads = self.config.num_key_value_heads
+        head_dim = getattr(self.config, "head_dim", None) or self.config.hidden_size // self.config.num_attention_heads
+        return {name: np.zeros((batch, heads, 0, head_dim), dtype=np.float32) for name in self.past_names}
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=256, do_sample=False, repetition_penalty=1.0,
+                 logits_processor=None, stopping_criteria=None, pad_token_id=None, eos_token_id=None,
+                 streamer=None, **kwargs):
+        import numpy as np
+        from transformers import LogitsProcessorList, RepetitionPenaltyLogitsProcessor
+
+        if do_sample:
+            raise ValueError("The ONNX backend only supports greedy decoding")
+        if kwargs.get("past_key_values") is not None:
+            raise ValueError("The ONNX backend does not take a PyTorch KV cache")
+
+        processors = LogitsProcessorList()
+        if repetition_penalty and repetition_penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+        processors.extend(logits_processor or [])
+
+        eos = eos_token_id if eos_token_id is not None else self.generation_config.eos_token_id
+        eos = set(eos if isinstance(eos, (list, tuple)) else [eos]) - {None}
+        pad = pad_token_id if pad_token_id is not None else self.generation_config.pad_token_id
+
+        sequences = input_ids.cpu()
+        mask = (attention_mask if attention_mask is not None else torch.ones_like(input_ids)).cpu().long()
+        # Left padding: positions count only the real tokens, as in transformers
+        positions = (mask.cumsum(-1) - 1).clamp(min=0)
+        unfinished = torch.ones(sequences.shape[0], dtype=torch.bool)
+        if streamer is not None:
+            streamer.put(sequences)
+
+        feed = {
+            "input_ids": sequences.numpy(),
+            "attention_mask": mask.numpy(),
+            "position_ids": positions.numpy(),
+            **self._empty_past(sequences.shape[0]),
+        }
+        for _ in range(max_new_tokens):
+            outputs = self.session.run(None, feed)
+            scores = processors(sequences, torch.from_numpy(outputs[0][:, -1, :]).float())
+            next_tokens = scores.argmax(dim=-1)
+            if pad is not None:
+                next_tokens = torch.where(unfinished, next_tokens, torch.full_like(next_tokens, pad))
+            sequences = torch.cat([sequences, next_tokens[:, None]], dim=-1)
+            if streamer is not None:
+                streamer.put(next_tokens)
+
+            unfinished &= ~torch.isin(next_tokens, torch.tensor(sorted(eos), dtype=next_tokens.dtype))
+            for criteria in stopping_criteria or []:
+                unfinished &= ~criteria(sequences, scores)
+            if not unfinished.any():
+                break
+
+            mask = torch.cat([mask, torch.ones_like(mask[:, :1])], dim=-1)
+            positions = positions[:, -1:] + 1
+            feed = {
+                "input_ids": next_tokens[:, None].numpy(),
+                "attention_mask": mask.numpy(),
+                "position_ids": positions.numpy(),
+                **dict(zip(self.past_names, outputs[1:])),
+            }
+
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+
+def load_onnx_model(model_dir):
+    configure_cpu_threads()
+    return OnnxCausalLM(model_dir)
+
+################################################
+#tokens/sec comparison
+################################################
+
+def measure_tokens_per_sec(model, tokenizer, messages, device, max_new_tokens=128):
+    inputs = tokenizer.apply_chat_template(
+        messages,
+        add_generation_prompt=True,
+        tokenize=True,
+        return_dict=True,
+        return_tensors="pt",
+    ).to(device)
+
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, repetition_penalty=1.1)
+    elapsed = time.perf_counter() - start
+
+    new_tokens = outputs.shape[-1] - inputs["input_ids"].shape[-1]
+    return new_tokens / elapsed if elapsed > 0 else 0.0
+
+
+def benchmark_cpu_precisions(base_path, adapter_path, text, precisions=("fp32", "int8", "bf16"), max_new_tokens=128):
+    from Model_Processing.Model_Using import system_instruction
+
+    tokenizer = AutoTokenizer.from_pretrained(base_path)
+    messages = [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": text},
+    ]
+
+    results = {}
+    for precision in precisions:
+        if resolve_cpu_precision(precision) != precision:
+            continue
+        base_model = AutoModelForCausalLM.from_pretrained(base_path, torch_dtype=load_dtype("cpu", precision))
+        model = prepare_model_for_device(PeftModel.from_pretrained(base_model, adapter_path), "cpu", precision)
+        model.eval()
+        results[precision] = measure_tokens_per_sec(model, tokenizer, messages, "cpu", max_new_tokens)
+        del model, base_model
+
+    baseline = results.get("fp32")
+    for precision, tps in results.items():
+        speedup = f" ({tps / baseline:.2f}x vs fp32)" if baseline else ""
+        print(f"{precision:>5}: {tps:.2f} tokens/sec{speedup}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CPU tokens/sec for fp32, int8 and bf16")
+    parser.add_argument("base_path")
+    parser.add_argument("adapter_path")
+    parser.add_argument("--text", default="Cloud computing is the on-demand delivery of IT resources over the internet.")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+    benchmark_cpu_precisions(args.base_path, args.adapter_path, args.text, max_new_tokens=args.max_new_tokens)
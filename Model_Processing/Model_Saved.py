@@ -1,5 +1,10 @@
 import os
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import json
+import time
+import random
+import argparse
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
 from peft import PeftModel
 
 
@@ -9,13 +14,231 @@ adapter_id = "mohammedkhas/customized-ar-translator"
 
 local_base_path = r"C:\Users\User\OneDrive\DA350P\models"
 local_adapter_path = r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1"
+# base + adapter fused into one checkpoint (see export_merged)
+local_merged_path = r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1_merged"
+# ONNX export of the merged model for ONNX Runtime on CPU (see export_onnx)
+local_onnx_path = r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1_onnx"
 
-tokenizer = AutoTokenizer.from_pretrained(base_model_id)
-base_model = AutoModelForCausalLM.from_pretrained(base_model_id)
+sample_data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "full_json2.json")
 
 
-tokenizer.save_pretrained(local_base_path)
-base_model.save_pretrained(local_base_path)
+def save_separate():
+    tokenizer = AutoTokenizer.from_pretrained(base_model_id)
+    base_model = AutoModelForCausalLM.from_pretrained(base_model_id)
 
-model = PeftModel.from_pretrained(base_model, adapter_id)
-model.save_pretrained(local_adapter_path)
\ No newline at end of file
+
+    tokenizer.save_pretrained(local_base_path)
+    base_model.save_pretrained(local_base_path)
+
+    model = PeftModel.from_pretrained(base_model, adapter_id)
+    model.save_pretrained(local_adapter_path)
+
+################################################
+#merged export
+################################################
+
+def export_merged(output_path=local_merged_path):
+    """Fold the LoRA weights into the base model and save one safetensors checkpoint."""
+    tokenizer = AutoTokenizer.from_pretrained(local_base_path)
+    base_model = AutoModelForCausalLM.from_pretrained(local_base_path, torch_dtype=torch.float32)
+
+    merged = PeftModel.from_pretrained(base_model, local_adapter_path).merge_and_unload()
+
+    os.makedirs(output_path, exist_ok=True)
+    merged.save_pretrained(output_path, safe_serialization=True)
+    tokenizer.save_pretrained(output_path)
+    print(f"Merged model saved to {output_path}")
+    return output_path
+
+
+def _greedy(model, tokenizer, messages, max_new_tokens):
+    inputs = tokenizer.apply_chat_template(
+        messages,
+        add_generation_prompt=True,
+        tokenize=True,
+        return_dict=True,
+        return_tensors="pt",
+    ).to(model.device)
+    with torch.no_grad():
+        outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, repetition_penalty=1.1)
+    return tokenizer.decode(outputs[0][inputs["input_ids"].shape[-1]:], skip_special_tokens=True)
+
+
+def load_samples(sample_size, data_path=sample_data_path, seed=42):
+    with open(data_path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    random.Random(seed).shuffle(samples)
+    return samples[:sample_size]
+
+
+def validate_merged(merged_path=local_merged_path, sample_size=5, max_new_tokens=256):
+    """Check that the merged checkpoint gives the same greedy output as base + adapter."""
+    from Model_Processing.Model_Using import build_messages
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    tokenizer = AutoTokenizer.from_pretrained(local_base_path)
+
+    base_model = AutoModelForCausalLM.from_pretrained(local_base_path, torch_dtype=torch.float32)
+    unmerged = PeftModel.from_pretrained(base_model, local_adapter_path).to(device).eval()
+    merged = AutoModelForCausalLM.from_pretrained(merged_path, torch_dtype=torch.float32).to(device).eval()
+
+    mismatches = 0
+    samples = load_samples(sample_size)
+    for i, sample in enumerate(samples):
+        messages = build_messages(sample)
+        expected = _greedy(unmerged, tokenizer, messages, max_new_tokens)
+        actual = _greedy(merged, tokenizer, messages, max_new_tokens)
+        if expected != actual:
+            mismatches += 1
+            print(f"Sample {i}: MISMATCH")
+            print(f"  unmerged: {expected[:200]!r}")
+            print(f"  merged:   {actual[:200]!r}")
+        else:
+            print(f"Sample {i}: OK")
+
+    print(f"{len(samples) - mismatches}/{len(samples)} samples match")
+    return mismatches == 0
+
+################################################
+#ONNX export
+################################################
+
+class _OnnxExportWrapper(torch.nn.Module):
+    # Flat tensors in and out, so the graph has one named input/output per
+    # layer key and value: past_key_values.{i}.key / present.{i}.key ...
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.num_layers = model.config.num_hidden_layers
+
+    def forward(self, input_ids, attention_mask, position_ids, *past):
+        cache = DynamicCache()
+        for layer in range(self.num_layers):
+            cache.update(past[2 * layer], past[2 * layer + 1], layer)
+        out = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                         past_key_values=cache, use_cache=True)
+        present = out.past_key_values
+        if hasattr(present, "layers"):
+            tensors = [(layer.keys, layer.values) for layer in present.layers]
+        else:
+            tensors = list(zip(present.key_cache, present.value_cache))
+        return (out.logits, *[t for pair in tensors for t in pair])
+
+
+def _load_merged_fp32(merged_path=local_merged_path):
+    if os.path.isdir(merged_path):
+        return AutoModelForCausalLM.from_pretrained(merged_path, torch_dtype=torch.float32)
+    base_model = AutoModelForCausalLM.from_pretrained(local_base_path, torch_dtype=torch.float32)
+    return PeftModel.from_pretrained(base_model, local_adapter_path).merge_and_unload()
+
+
+def export_onnx(output_path=local_onnx_path, merged_path=local_merged_path, quantize=False, opset=17):
+    """Export the merged model to ONNX with KV-cache inputs/outputs (model.onnx).
+
+    With quantize, the weights are also quantized to int8 (model_int8.onnx),
+    which Model_Backend.OnnxCausalLM then loads by default.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(local_base_path)
+    model = _load_merged_fp32(merged_path).eval()
+    config = model.config
+    layers = config.num_hidden_layers
+    heads = config.num_key_value_heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+
+    # Traced with a non-empty cache so the past length stays a dynamic axis
+    past = [torch.zeros(1, heads, 2, head_dim) for _ in range(2 * layers)]
+    input_ids = torch.tensor([[tokenizer.eos_token_id] * 3])
+    attention_mask = torch.ones(1, 5, dtype=torch.long)
+    position_ids = torch.arange(2, 5)[None]
+
+    past_names = [f"past_key_values.{i}.{kind}" for i in range(layers) for kind in ("key", "value")]
+    present_names = [f"present.{i}.{kind}" for i in range(layers) for kind in ("key", "value")]
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "total_sequence"},
+        "position_ids": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+        **{name: {0: "batch", 2: "past_sequence"} for name in past_names},
+        **{name: {0: "batch", 2: "total_sequence"} for name in present_names},
+    }
+
+    os.makedirs(output_path, exist_ok=True)
+    onnx_file = os.path.join(output_path, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            _OnnxExportWrapper(model),
+            (input_ids, attention_mask, position_ids, *past),
+            onnx_file,
+            input_names=["input_ids", "attention_mask", "position_ids"] + past_names,
+            output_names=["logits"] + present_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+    config.save_pretrained(output_path)
+    model.generation_config.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+    print(f"ONNX model saved to {onnx_file}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_file = os.path.join(output_path, "model_int8.onnx")
+        quantize_dynamic(onnx_file, quantized_file, weight_type=QuantType.QInt8)
+        print(f"int8 ONNX model saved to {quantized_file}")
+    return output_path
+
+
+def validate_onnx(onnx_path=local_onnx_path, merged_path=local_merged_path, sample_size=5, max_new_tokens=256, file_name=None):
+    """Check that ONNX Runtime gives the same greedy output as the PyTorch model."""
+    from Model_Processing.Model_Using import build_messages
+    from Model_Processing.Model_Backend import OnnxCausalLM
+
+    tokenizer = AutoTokenizer.from_pretrained(onnx_path)
+    reference = _load_merged_fp32(merged_path).eval()
+    onnx_model = OnnxCausalLM(onnx_path, file_name=file_name)
+
+    mismatches = 0
+    seconds = {"pytorch": 0.0, "onnx": 0.0}
+    samples = load_samples(sample_size)
+    for i, sample in enumerate(samples):
+        messages = build_messages(sample)
+        start = time.perf_counter()
+        expected = _greedy(reference, tokenizer, messages, max_new_tokens)
+        seconds["pytorch"] += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = _greedy(onnx_model, tokenizer, messages, max_new_tokens)
+        seconds["onnx"] += time.perf_counter() - start
+        if expected != actual:
+            mismatches += 1
+            print(f"Sample {i}: MISMATCH")
+            print(f"  pytorch: {expected[:200]!r}")
+            print(f"  onnx:    {actual[:200]!r}")
+        else:
+            print(f"Sample {i}: OK")
+
+    print(f"{len(samples) - mismatches}/{len(samples)} samples match ({onnx_model.file_name}); "
+          f"pytorch {seconds['pytorch']:.1f}s, onnx {seconds['onnx']:.1f}s")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download/save the model, or export a merged checkpoint")
+    parser.add_argument("--merge", action="store_true", help="merge the adapter into the base model and save it")
+    parser.add_argument("--onnx", action="store_true", help="export the merged model to ONNX with KV-cache inputs/outputs")
+    parser.add_argument("--int8", action="store_true", help="with --onnx, also write int8-quantized weights")
+    parser.add_argument("--validate", type=int, default=5, metavar="N", help="samples of full_json2.json to compare after merging (0 to skip)")
+    args = parser.parse_args()
+
+    if args.merge:
+        export_merged()
+        if args.validate and not validate_merged(sample_size=args.validate):
+            raise SystemExit("Merged model output differs from base + adapter")
+    elif args.onnx:
+        export_onnx(quantize=args.int8)
+        if args.validate and not validate_onnx(sample_size=args.validate, file_name="model.onnx"):
+            raise SystemExit("ONNX output differs from the PyTorch model")
+        if args.validate and args.int8:
+            # int8 weights can change a few greedy choices, so this is only reported
+            validate_onnx(sample_size=args.validate, file_name="model_int8.onnx")
+    else:
+        save_separate()
@@ -1,18 +1,205 @@
 import os
+import copy
 import json
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import time
+import hashlib
+import logging
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, TextIteratorStreamer, LogitsProcessorList, StoppingCriteriaList
 import torch
 from peft import PeftModel
+from Model_Processing.Model_Backend import select_device, load_dtype, prepare_model_for_device, load_onnx_model, BACKEND
+from Model_Processing import Translation_Cache, Translation_Memory, Adapter_Registry, Glossary
+from Model_Processing.Adapter_Registry import ADAPTERS, DEFAULT_ADAPTER, MAX_RESIDENT_ADAPTERS
+from Model_Processing.Json_Constraint import JsonSchemaLogitsProcessor, JsonDoneStoppingCriteria
+from Model_Processing.Response_utils import split_translated, join_translated, merge_explaining, chunk_lines, merge_chunks
+from Metrics_utils import span, count, log_event, register_stats
 
 local_base_path = r"C:\Users\User\OneDrive\DA350P\models"
-local_adapter_path = r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1"
+# The default adapter; every selectable adapter is listed in Adapter_Registry.py
+local_adapter_path = Adapter_Registry.adapter_path(DEFAULT_ADAPTER)
+# fused base + adapter written by `Model_Saved.py --merge`; used when present
+local_merged_path = r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1_merged"
+# written by `Model_Saved.py --onnx`; used with TRANSLATOR_BACKEND=onnx
+local_onnx_path = r"C:\Users\User\OneDrive\DA350P\models\0.5B_d1_onnx"
 
-tokenizer = AutoTokenizer.from_pretrained(local_base_path, fix_mistral_regex=True)
-base_model = AutoModelForCausalLM.from_pretrained(local_base_path).to("cuda")
+# The 1.5B model, used by translate_assisted with the 0.5B model above as draft
+large_base_path = r"C:\Users\User\OneDrive\DA350P\models\1.5B"
+large_adapter_path = r"C:\Users\User\OneDrive\DA350P\models\1.5B_d1"
+large_merged_path = r"C:\Users\User\OneDrive\DA350P\models\1.5B_d1_merged"
 
-Lora = PeftModel.from_pretrained(base_model, local_adapter_path)
+# When set (e.g. http://127.0.0.1:8765), translations are sent to the shared
+# inference server (Model_Processing/Inference_Server.py) instead of loading
+# a model in this process
+SERVER_URL = os.environ.get("TRANSLATOR_SERVER_URL")
+SERVER_TIMEOUT = float(os.environ.get("TRANSLATOR_SERVER_TIMEOUT", "600"))
 
-Lora.eval()
+GENERATION_PARAMS = {"max_new_tokens": 1024, "do_sample": False, "repetition_penalty": 1.1}
+# Only let the model write the {"translated", "explaining"} object and stop
+# right after its closing brace (see Json_Constraint.py)
+CONSTRAINED_DECODING = os.environ.get("TRANSLATOR_CONSTRAINED", "0") == "1"
+# Slide text longer than this many tokens is split on line boundaries and the
+# chunks are translated as one batch. The answer (Arabic + explanations) runs
+# a few times longer than its input, so this keeps it inside max_new_tokens.
+CHUNK_TOKENS = int(os.environ.get("TRANSLATOR_CHUNK_TOKENS", "256"))
+
+# cuda or cpu, chosen automatically or with TRANSLATOR_DEVICE; ONNX Runtime runs on cpu
+device = "cpu" if BACKEND == "onnx" else select_device()
+
+################################################
+#lazy model loading (one copy per process)
+################################################
+
+_tokenizer = None
+_model = None
+_load_lock = threading.Lock()
+_warm_up_thread = None
+
+LOAD_STATS = {"device": device, "backend": BACKEND, "load_seconds": None, "merged": None}
+
+
+def _load_model(base_path=local_base_path, adapter_path=local_adapter_path, merged_path=local_merged_path, adapter_name=None):
+    # adapter_name: keep the PEFT wrapper with the adapter under that name, so
+    # more adapters can be loaded next to it (see use_adapter)
+    if BACKEND == "onnx":
+        # The export is made from the merged model and carries its tokenizer
+        return AutoTokenizer.from_pretrained(local_onnx_path), load_onnx_model(local_onnx_path), True
+
+    tokenizer = AutoTokenizer.from_pretrained(base_path, fix_mistral_regex=True)
+    # safetensors are memory-mapped, low_cpu_mem_usage skips the random init
+    # of the weights, so only one copy is ever materialised
+    use_merged = bool(merged_path) and os.path.isdir(merged_path)
+    base_model = AutoModelForCausalLM.from_pretrained(
+        merged_path if use_merged else base_path,
+        torch_dtype=load_dtype(device),
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
+        device_map=device if device == "cuda" else None,
+    )
+
+    # The merged checkpoint already contains the LoRA weights, so there is no
+    # PEFT wrapper and no extra adapter matmuls per projection
+    if use_merged:
+        model = base_model
+    elif adapter_name:
+        model = PeftModel.from_pretrained(base_model, adapter_path, adapter_name=adapter_name)
+    else:
+        model = PeftModel.from_pretrained(base_model, adapter_path)
+    model = prepare_model_for_device(model, device, keep_adapters=bool(adapter_name))
+    model.eval()
+    return tokenizer, model, use_merged
+
+
+def get_model():
+    """Return (tokenizer, model), loading them on first use."""
+    global _tokenizer, _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                start = time.perf_counter()
+                with span("model_load", device=device, backend=BACKEND) as attrs:
+                    if Adapter_Registry.is_multi_adapter() and BACKEND != "onnx":
+                        # The merged checkpoint holds one adapter only, so it is not used here
+                        _tokenizer, _model, LOAD_STATS["merged"] = _load_model(merged_path=None, adapter_name=DEFAULT_ADAPTER)
+                        _resident_adapters.clear()
+                        _resident_adapters[DEFAULT_ADAPTER] = True
+                    else:
+                        _tokenizer, _model, LOAD_STATS["merged"] = _load_model()
+                    attrs["merged"] = LOAD_STATS["merged"]
+                LOAD_STATS["load_seconds"] = time.perf_counter() - start
+    return _tokenizer, _model
+
+
+def set_model(tokenizer, model):
+    """Use an already loaded tokenizer/model instead of loading from disk (benchmarks)."""
+    global _tokenizer, _model
+    with _load_lock:
+        _tokenizer, _model = tokenizer, model
+        _resident_adapters.clear()
+        if isinstance(model, PeftModel):
+            _resident_adapters.update((name, True) for name in model.peft_config)
+
+
+def is_model_loaded():
+    return _model is not None
+
+
+def warm_up(background=True):
+    """Start loading the model now so the first translation does not wait for it."""
+    global _warm_up_thread
+    if not background:
+        get_model()
+        return None
+    with _load_lock:
+        if _model is None and _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=get_model, name="model-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+################################################
+#adapter hot-swap (one base model, several LoRA adapters)
+################################################
+
+_resident_adapters = OrderedDict()
+_adapter_lock = threading.RLock()
+
+ADAPTER_STATS = {"loads": 0, "evictions": 0, "switches": 0}
+
+
+def check_adapter(name):
+    """Return the adapter name to use for name (None = default) or an "Error: ..." string."""
+    name = name or DEFAULT_ADAPTER
+    if name not in ADAPTERS:
+        return f"Error: Unknown adapter '{name}'. Available: {', '.join(ADAPTERS)}"
+    if name != DEFAULT_ADAPTER and BACKEND == "onnx":
+        return f"Error: Adapter '{name}' is not available with the ONNX backend"
+    return name
+
+
+@contextmanager
+def use_adapter(name=None):
+    """Make adapter name active for the duration of the block.
+
+    Adapters are loaded onto the shared base model on first use; once more
+    than MAX_RESIDENT_ADAPTERS are loaded the least recently used one is
+    deleted. The block holds a lock, so two threads never generate with each
+    other's adapter.
+    """
+    name = name or DEFAULT_ADAPTER
+    with _adapter_lock:
+        _, model = get_model()
+        if not isinstance(model, PeftModel) or not Adapter_Registry.is_multi_adapter():
+            # Single adapter, merged into the weights (or an ONNX export)
+            if name != DEFAULT_ADAPTER:
+                raise ValueError(f"Adapter '{name}' is not loaded")
+            yield name
+            return
+
+        if name not in _resident_adapters:
+            with span("adapter_load", adapter=name):
+                model.load_adapter(Adapter_Registry.adapter_path(name), adapter_name=name)
+            _resident_adapters[name] = True
+            ADAPTER_STATS["loads"] += 1
+        if model.active_adapter != name:
+            model.set_adapter(name)
+            ADAPTER_STATS["switches"] += 1
+        _resident_adapters.move_to_end(name)
+
+        while len(_resident_adapters) > MAX_RESIDENT_ADAPTERS:
+            evicted, _ = _resident_adapters.popitem(last=False)
+            model.delete_adapter(evicted)
+            _prefix_caches.pop(evicted, None)
+            ADAPTER_STATS["evictions"] += 1
+            log_event("adapter.evicted", adapter=evicted)
+        yield name
+
+
+def resident_adapters():
+    return list(_resident_adapters)
 
 system_instruction = """You are an expert English-to-Arabic technical translator and Front-End Developer.
 
@@ -76,14 +263,27 @@ STRICT CONSTRAINTS
 - Do NOT include code fences (like ```json).
 - Do NOT add any text outside the JSON."""
 
+# The rules above are learned by the adapters, so an adapter fine-tuned with
+# this one-line prompt instead (Lora_Finetune.ipynb, "Compact prompt") needs
+# ~900 fewer prompt tokens per slide. Such an adapter is registered with
+# "|compact" after its path (Adapter_Registry.py) and gets this prompt; the
+# others keep the full one (see benchmarks/bench_prompt.py).
+compact_system_instruction = 'Translate the IT slide text into Arabic. Answer with the JSON object {"translated", "explaining"}.'
 
 
-def prepare_response(res):
+def active_system_instruction(adapter=None):
+    """The system prompt adapter (None = the default) was trained with."""
+    if Adapter_Registry.prompt_mode(adapter) == "compact":
+        return compact_system_instruction
+    return system_instruction
+
+
+
+def parse_response(res):
+    """Return the {translated, explaining} dict from raw model output, or an error string."""
     try:
-        print("\n" + "="*50)
-        print("DEBUG: MODEL OUTPUT RECEIVED:")
-        print(res)
-        print("="*50 + "\n")
+        # Raw output only at TRANSLATOR_LOG_LEVEL=DEBUG
+        log_event("model.output", level=logging.DEBUG, output=res)
 
         start_idx = res.find('{')
         end_idx = res.rfind('}') + 1 
@@ -95,7 +295,22 @@ def prepare_response(res):
         
     except Exception as e:
         return f"Error parsing JSON: {e}"
+    if not isinstance(result_text, dict):
+        return "Error parsing JSON: expected an object"
+    return result_text
+
 
+def prepare_response(res, en_text=None):
+    result_text = parse_response(res)
+    if isinstance(result_text, str):
+        return result_text
+    if en_text:
+        # Terms the glossary knows get its explanation (see Glossary.py)
+        result_text = Glossary.fill_explaining(result_text, en_text)
+    return build_html(result_text)
+
+
+def build_html(result_text):
     # 2. Inject the Dictionary values into the HTML String
     # NOTICE: We use result_text.get(), NOT html_text.get()
     html_text = f"""
@@ -132,37 +347,572 @@ def prepare_response(res):
     return html_text
 
 
-def translate_and_generate_html(data_input):
-
+def load_slide_data(data_input):
     if isinstance(data_input, str):
         try:
-            data = json.loads(data_input)
+            return json.loads(data_input)
         except json.JSONDecodeError:
             return "Error: Invalid JSON input received from extractor."
-    else:
-        data = data_input
+    if not isinstance(data_input, dict) or "en" not in data_input:
+        return "Error: Invalid JSON input received from extractor."
+    return data_input
 
+
+def build_messages(data, adapter=None, instruction=None):
+    # instruction overrides the adapter's own system prompt
     messages = [
-    {"role": "system","content":f"{system_instruction}"},
+    {"role": "system","content":f"{instruction or active_system_instruction(adapter)}"},
     {"role": "user", "content": f"{data['en']}"},
     ]
+    # Known glossary terms go in a second system turn: the user turn stays the
+    # text to translate and the system prompt KV cache still matches
+    note = Glossary.prompt_note(data["en"])
+    if note:
+        messages.insert(1, {"role": "system", "content": note})
+    return messages
 
-    inputs = tokenizer.apply_chat_template(
+
+def prompt_ids(tokenizer, messages, add_generation_prompt=True):
+    return tokenizer.apply_chat_template(
 	messages,
+	add_generation_prompt=add_generation_prompt,
+	tokenize=True,
+	return_dict=True,
+    )["input_ids"]
+
+
+def translate_and_generate_html(data_input, adapter=None):
+    if SERVER_URL:
+        return _translate_remote(data_input, adapter)
+    return translate_batch([data_input], batch_size=1, adapter=adapter)[0]
+
+
+def _translate_remote(data_input, adapter=None):
+    data = load_slide_data(data_input) if data_input != 0 else "Error: No text extracted from this slide."
+    if isinstance(data, str):
+        return data
+    if adapter:
+        data = dict(data, adapter=adapter)
+    request = urllib.request.Request(
+        SERVER_URL.rstrip("/") + "/translate",
+        data=json.dumps(data, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=SERVER_TIMEOUT) as response:
+            return json.loads(response.read().decode("utf-8"))["html"]
+    except Exception as e:
+        return f"Error: Inference server request failed: {e}"
+
+
+def cache_key(data, adapter=None):
+    params = dict(GENERATION_PARAMS, constrained=CONSTRAINED_DECODING, chunk_tokens=CHUNK_TOKENS, backend=BACKEND,
+                  prompt=hashlib.sha256(active_system_instruction(adapter).encode("utf-8")).hexdigest(), glossary=Glossary.version())
+    return Translation_Cache.make_key(data["en"], Adapter_Registry.adapter_path(adapter), params)
+
+################################################
+#system prompt KV cache
+################################################
+
+# One entry per adapter: the system prompt's KV values depend on the LoRA weights
+_prefix_caches = {}
+_prefix_lock = threading.Lock()
+
+PREFIX_CACHE_STATS = {"builds": 0, "hits": 0, "seconds_saved": 0.0, "last_seconds_saved": 0.0}
+
+
+def _prefix_cache_key(model, adapter):
+    # A new prompt, another adapter or a reloaded model all produce a new key
+    prompt_hash = hashlib.sha256(active_system_instruction(adapter).encode("utf-8")).hexdigest()
+    return (prompt_hash, Adapter_Registry.adapter_path(adapter), LOAD_STATS["merged"], id(model))
+
+
+def _get_prefix_entry(adapter=None):
+    adapter = adapter or DEFAULT_ADAPTER
+    tokenizer, Lora = get_model()
+    key = _prefix_cache_key(Lora, adapter)
+    with use_adapter(adapter), _prefix_lock:
+        entry = _prefix_caches.get(adapter)
+        if entry is None or entry["key"] != key:
+            ids = prompt_ids(tokenizer, [{"role": "system", "content": active_system_instruction(adapter)}], add_generation_prompt=False)
+            start = time.perf_counter()
+            with torch.no_grad():
+                out = Lora(input_ids=torch.tensor([ids], device=device), use_cache=True)
+            past = out.past_key_values
+            if isinstance(past, tuple):
+                past = DynamicCache.from_legacy_cache(past)
+            entry = {"key": key, "ids": ids, "past_key_values": past, "seconds": time.perf_counter() - start}
+            _prefix_caches[adapter] = entry
+            PREFIX_CACHE_STATS["builds"] += 1
+        return entry
+
+
+def get_prefix_cache(adapter=None):
+    """Return (prefix_ids, past_key_values) for the system prompt, built once per model and adapter."""
+    entry = _get_prefix_entry(adapter)
+    return entry["ids"], entry["past_key_values"]
+
+
+def _build_inputs(prompts, pad_id, adapter=None):
+    """Left-pad prompts; reuse the system prompt KV cache when every prompt starts with it.
+
+    With the cache the rows look like [system prompt][padding][user turn], so the
+    cached prefix is the same for every row and the padding is simply masked out.
+    """
+    if BACKEND == "onnx":
+        # ONNX Runtime keeps its own KV tensors; the PyTorch prefix cache does not apply
+        prefix = {"ids": [], "past_key_values": None, "seconds": 0.0}
+    else:
+        prefix = _get_prefix_entry(adapter)
+    prefix_ids, prefix_past = prefix["ids"], prefix["past_key_values"]
+    n = len(prefix_ids)
+    use_prefix = n > 0 and all(ids[:n] == prefix_ids for ids in prompts)
+
+    head = prefix_ids if use_prefix else []
+    tails = [ids[n:] if use_prefix else ids for ids in prompts]
+    width = max(len(tail) for tail in tails)
+
+    input_ids, attention_mask = [], []
+    for tail in tails:
+        pad = width - len(tail)
+        input_ids.append(head + [pad_id] * pad + tail)
+        attention_mask.append([1] * len(head) + [0] * pad + [1] * len(tail))
+
+    inputs = {
+        "input_ids": torch.tensor(input_ids, device=device),
+        "attention_mask": torch.tensor(attention_mask, device=device),
+    }
+    if use_prefix:
+        # generate() extends the cache in place, so every call gets its own copy
+        past = copy.deepcopy(prefix_past)
+        if len(prompts) > 1:
+            past.batch_repeat_interleave(len(prompts))
+        inputs["past_key_values"] = past
+
+        saved = prefix["seconds"] * len(prompts)
+        PREFIX_CACHE_STATS["hits"] += len(prompts)
+        PREFIX_CACHE_STATS["seconds_saved"] += saved
+        PREFIX_CACHE_STATS["last_seconds_saved"] = prefix["seconds"]
+        log_event("prefix_cache.hit", rows=len(prompts), skipped_tokens=n, seconds_saved=round(saved, 4))
+    return inputs
+
+def _constraint_kwargs(tokenizer):
+    if not CONSTRAINED_DECODING:
+        return {}
+    # A fresh processor per generate() call: it tracks the state of every row
+    processor = JsonSchemaLogitsProcessor(tokenizer, tokenizer.eos_token_id)
+    return {
+        "logits_processor": LogitsProcessorList([processor]),
+        "stopping_criteria": StoppingCriteriaList([JsonDoneStoppingCriteria(processor)]),
+    }
+
+################################################
+#batched translation (many slides at once)
+################################################
+
+def _chunks_of(tokenizer, lines):
+    def count_tokens(text):
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    return chunk_lines(lines, count_tokens, CHUNK_TOKENS)
+
+
+def _generate_batch(prompts, adapter=None):
+    tokenizer, Lora = get_model()
+    with use_adapter(adapter) as adapter, span("generate", batch=len(prompts), adapter=adapter) as attrs:
+        inputs = _build_inputs(prompts, tokenizer.pad_token_id, adapter)
+
+        with torch.no_grad():
+            outputs = Lora.generate(
+            **inputs,
+            **GENERATION_PARAMS,
+            **_constraint_kwargs(tokenizer),
+            pad_token_id=tokenizer.pad_token_id
+            )
+        prompt_len = inputs["input_ids"].shape[-1]
+        new_tokens = int((outputs[:, prompt_len:] != tokenizer.pad_token_id).sum())
+        attrs.update(prompt_tokens=sum(len(ids) for ids in prompts), new_tokens=new_tokens)
+        count("prompt_tokens", attrs["prompt_tokens"])
+        count("generated_tokens", new_tokens)
+    return tokenizer.batch_decode(outputs[:, prompt_len:], skip_special_tokens=True)
+
+
+def _generate_all(prompts, batch_size, adapter=None):
+    """Generate for every prompt, in input order, with per-prompt error isolation."""
+    decoded = [None] * len(prompts)
+    # Sorting by length keeps the padding inside each batch small
+    order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        try:
+            outputs = _generate_batch([prompts[i] for i in chunk], adapter)
+        except Exception:
+            # Retry one by one so a single bad slide cannot sink the batch
+            outputs = []
+            for i in chunk:
+                try:
+                    outputs.append(_generate_batch([prompts[i]], adapter)[0])
+                except Exception as slide_error:
+                    outputs.append(f"Error: Generation failed: {slide_error}")
+        for i, qwen_res in zip(chunk, outputs):
+            decoded[i] = qwen_res
+    return decoded
+
+
+def _assemble(lines, known, explaining, adapter_id):
+    result_text = {
+        "translated": join_translated([known[line] for line in lines]),
+        "explaining": merge_explaining(explaining, Translation_Memory.explaining_for("\n".join(lines), adapter_id)),
+    }
+    return result_text
+
+
+def translate_batch(data_inputs, batch_size=8, adapter=None):
+    """Translate many slide payloads and return their HTML in the same order.
+
+    A slide that fails (bad input, bad JSON from the model, generation error)
+    gets its own "Error: ..." string; the other slides are not affected.
+    Slides are answered from the translation cache or assembled from the
+    line-level translation memory when possible; otherwise only the lines the
+    memory does not know are sent to the model.
+    Each payload may name its own "adapter" (default: the adapter argument);
+    slides are batched per adapter.
+    With TRANSLATOR_SERVER_URL set the slides are posted to the inference
+    server instead, up to batch_size at a time, and it batches them itself.
+    """
+    if SERVER_URL:
+        with ThreadPoolExecutor(max_workers=max(1, batch_size)) as pool:
+            return list(pool.map(lambda data_input: _translate_remote(data_input, adapter), data_inputs))
+
+    with span("translate", slides=len(data_inputs), cache_hits=0, memory_hits=0) as attrs:
+        results = [None] * len(data_inputs)
+        jobs = []
+
+        for i, data_input in enumerate(data_inputs):
+            if data_input == 0:
+                results[i] = "Error: No text extracted from this slide."
+                continue
+            data = load_slide_data(data_input)
+            if isinstance(data, str):
+                results[i] = data
+                continue
+            name = check_adapter(data.get("adapter") or adapter)
+            if name.startswith("Error:"):
+                results[i] = name
+                continue
+            adapter_id = Adapter_Registry.adapter_path(name)
+            key = cache_key(data, name)
+            cached = Translation_Cache.get(key)
+            if cached is not None:
+                attrs["cache_hits"] += 1
+                results[i] = build_html(cached)
+                continue
+
+            lines = data["en"].split("\n")
+            known = Translation_Memory.lookup(lines, adapter_id)
+            missing = [line for line in lines if line not in known]
+            Translation_Memory.MEMORY_STATS["lines_reused"] += len(lines) - len(missing)
+            if not missing:
+                result_text = Glossary.fill_explaining(_assemble(lines, known, "", adapter_id), data["en"])
+                Translation_Memory.MEMORY_STATS["slides_assembled"] += 1
+                attrs["memory_hits"] += 1
+                Translation_Cache.put(key, result_text)
+                results[i] = build_html(result_text)
+                continue
+            jobs.append({"index": i, "key": key, "adapter": name, "lines": lines, "known": known, "missing": missing})
+
+        attrs["generated"] = len(jobs)
+        while jobs:
+            tokenizer, _ = get_model()
+            # Long slides become several prompts; all chunks of the slides that
+            # use the same adapter share the batches
+            for name in dict.fromkeys(job["adapter"] for job in jobs):
+                group = [job for job in jobs if job["adapter"] == name]
+                prompts = []
+                for job in group:
+                    job["chunks"] = _chunks_of(tokenizer, job["missing"])
+                    for chunk in job["chunks"]:
+                        prompts.append(prompt_ids(tokenizer, build_messages({"en": "\n".join(piece for _, piece in chunk)}, name)))
+                attrs["chunks"] = attrs.get("chunks", 0) + len(prompts)
+                decoded = iter(_generate_all(prompts, batch_size, name))
+                for job in group:
+                    job["decoded"] = [next(decoded) for _ in job["chunks"]]
+
+            retry = []
+            for job in jobs:
+                adapter_id = Adapter_Registry.adapter_path(job["adapter"])
+                Translation_Memory.MEMORY_STATS["lines_sent"] += len(job["missing"])
+                chunk_results = [
+                    qwen_res if qwen_res.startswith("Error:") else parse_response(qwen_res)
+                    for qwen_res in job["decoded"]
+                ]
+                errors = [r for r in chunk_results if isinstance(r, str)]
+                if errors:
+                    results[job["index"]] = errors[0]
+                    continue
+                if sum(len(chunk) for chunk in job["chunks"]) == len(job["missing"]) == len(job["chunks"][0]):
+                    result_text = chunk_results[0]
+                else:
+                    result_text = merge_chunks(job["chunks"], chunk_results)
+
+                partial = len(job["missing"]) < len(job["lines"])
+                aligned = Translation_Memory.learn("\n".join(job["missing"]), result_text, adapter_id)
+                if partial:
+                    if not aligned:
+                        # Segments could not be matched to lines; translate the whole slide instead
+                        retry.append(dict(job, known={}, missing=job["lines"]))
+                        continue
+                    known = dict(job["known"])
+                    known.update(zip(job["missing"], split_translated(result_text["translated"])))
+                    result_text = _assemble(job["lines"], known, result_text.get("explaining", ""), adapter_id)
+
+                result_text = Glossary.fill_explaining(result_text, "\n".join(job["lines"]))
+                Translation_Cache.put(job["key"], result_text)
+                results[job["index"]] = build_html(result_text)
+            jobs = retry
+
+    return results
+
+
+################################################
+#streaming generation (live preview)
+################################################
+
+class _CountingStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that also counts the generated tokens."""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.token_count = 0
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            self.token_count += value.numel()
+        super().put(value)
+
+
+def translate_stream(data_input, adapter=None):
+    """Like translate_and_generate_html, but yields progress while the model writes.
+
+    Yields {"done": False, "text": partial_output, "tokens": n, "tokens_per_sec": x}
+    for every new piece of text and finally {"done": True, "html": html_or_error}.
+    With TRANSLATOR_SERVER_URL set only the final message comes, from the inference server.
+    """
+    if SERVER_URL:
+        yield {"done": True, "html": _translate_remote(data_input, adapter)}
+        return
+    data = load_slide_data(data_input) if data_input != 0 else "Error: No text extracted from this slide."
+    if isinstance(data, str):
+        yield {"done": True, "html": data}
+        return
+    adapter = check_adapter(data.get("adapter") or adapter)
+    if adapter.startswith("Error:"):
+        yield {"done": True, "html": adapter}
+        return
+
+    key = cache_key(data, adapter)
+    cached = Translation_Cache.get(key)
+    if cached is not None:
+        log_event("translation_cache.hit", stream=True)
+        yield {"done": True, "html": build_html(cached)}
+        return
+
+    adapter_id = Adapter_Registry.adapter_path(adapter)
+    lines = data["en"].split("\n")
+    known = Translation_Memory.lookup(lines, adapter_id)
+    missing = [line for line in lines if line not in known]
+    Translation_Memory.MEMORY_STATS["lines_reused"] += len(lines) - len(missing)
+    if not missing:
+        result_text = Glossary.fill_explaining(_assemble(lines, known, "", adapter_id), data["en"])
+        Translation_Memory.MEMORY_STATS["slides_assembled"] += 1
+        Translation_Cache.put(key, result_text)
+        yield {"done": True, "html": build_html(result_text)}
+        return
+
+    tokenizer, Lora = get_model()
+    if len(_chunks_of(tokenizer, missing)) > 1:
+        # Too long for one bounded generation: translate the chunks as a batch
+        yield {"done": True, "html": translate_batch([data], adapter=adapter)[0]}
+        return
+    # Only the lines the memory does not know are streamed
+    ids = prompt_ids(tokenizer, build_messages({"en": "\n".join(missing)}, adapter))
+    streamer = _CountingStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    failure = []
+
+    def run():
+        # The adapter is held by this thread only while generate runs, so a
+        # caller that stops iterating early does not keep it locked
+        try:
+            with use_adapter(adapter), torch.no_grad():
+                inputs = _build_inputs([ids], tokenizer.pad_token_id, adapter)
+                Lora.generate(**inputs, **GENERATION_PARAMS, **_constraint_kwargs(tokenizer),
+                              pad_token_id=tokenizer.pad_token_id, streamer=streamer)
+        except Exception as e:
+            failure.append(e)
+            streamer.end()
+
+    worker = threading.Thread(target=run, name="translate-stream", daemon=True)
+    with span("generate", batch=1, stream=True, adapter=adapter, prompt_tokens=len(ids)) as attrs:
+        start = time.perf_counter()
+        worker.start()
+
+        qwen_res = ""
+        for piece in streamer:
+            qwen_res += piece
+            elapsed = time.perf_counter() - start
+            yield {
+                "done": False,
+                "text": qwen_res,
+                "tokens": streamer.token_count,
+                "tokens_per_sec": streamer.token_count / elapsed if elapsed > 0 else 0.0,
+            }
+        worker.join()
+        attrs["new_tokens"] = streamer.token_count
+        count("prompt_tokens", len(ids))
+        count("generated_tokens", streamer.token_count)
+
+    if failure:
+        yield {"done": True, "html": f"Error: Generation failed: {failure[0]}"}
+        return
+
+    result_text = parse_response(qwen_res)
+    if isinstance(result_text, str):
+        yield {"done": True, "html": result_text}
+        return
+    Translation_Memory.MEMORY_STATS["lines_sent"] += len(missing)
+    aligned = Translation_Memory.learn("\n".join(missing), result_text, adapter_id)
+    if known:
+        if not aligned:
+            # Segments could not be matched to lines; translate_batch redoes the whole slide
+            yield {"done": True, "html": translate_batch([data], adapter=adapter)[0]}
+            return
+        known = dict(known)
+        known.update(zip(missing, split_translated(result_text["translated"])))
+        result_text = _assemble(lines, known, result_text.get("explaining", ""), adapter_id)
+    result_text = Glossary.fill_explaining(result_text, data["en"])
+    Translation_Cache.put(key, result_text)
+    yield {"done": True, "html": build_html(result_text)}
+
+
+################################################
+#speculative decoding (0.5B drafts, 1.5B verifies)
+################################################
+
+_large_model = None
+_large_lock = threading.Lock()
+
+ASSISTED_STATS = {"drafted": 0, "accepted": 0, "target_calls": 0, "new_tokens": 0}
+
+register_stats("translation_cache", Translation_Cache.CACHE_STATS)
+register_stats("translation_memory", Translation_Memory.MEMORY_STATS)
+register_stats("prefix_cache", PREFIX_CACHE_STATS)
+register_stats("assisted", ASSISTED_STATS)
+register_stats("adapters", ADAPTER_STATS)
+register_stats("glossary", Glossary.GLOSSARY_STATS)
+
+
+def get_large_model():
+    """The 1.5B model, loaded on first use. It shares the Qwen2.5 tokenizer with the draft."""
+    global _large_model
+    if _large_model is None:
+        with _large_lock:
+            if _large_model is None:
+                with span("model_load", model="1.5B", device=device, backend=BACKEND):
+                    _, _large_model, _ = _load_model(large_base_path, large_adapter_path, large_merged_path)
+    return _large_model
+
+
+def _count_calls(model, counter):
+    def hook(module, args, output):
+        counter[0] += 1
+    if isinstance(model, PeftModel):
+        # PeftModel.generate calls the wrapped transformers model directly,
+        # so a hook on the wrapper would never fire
+        model = model.get_base_model()
+    return model.register_forward_hook(hook)
+
+
+def _assisted_generate(data, use_draft=True):
+    """Greedy generation with the 1.5B model; returns (text, stats)."""
+    tokenizer, draft = get_model()
+    target = get_large_model()
+    # The 1.5B adapter was trained with the full prompt, even when the draft adapter is compact
+    inputs = tokenizer.apply_chat_template(
+	build_messages(data, instruction=system_instruction),
 	add_generation_prompt=True,
 	tokenize=True,
 	return_dict=True,
 	return_tensors="pt",
-    ).to("cuda")
+    ).to(device)
+
+    target_calls, draft_calls = [0], [0]
+    hooks = [_count_calls(target, target_calls), _count_calls(draft, draft_calls)]
+    extra = {"assistant_model": draft} if use_draft else {}
+    start = time.perf_counter()
+    try:
+        # The draft is the default adapter
+        with use_adapter(DEFAULT_ADAPTER), torch.no_grad():
+            outputs = target.generate(**inputs, **GENERATION_PARAMS, **extra, pad_token_id=tokenizer.pad_token_id)
+    finally:
+        for hook in hooks:
+            hook.remove()
+    seconds = time.perf_counter() - start
+
+    new_tokens = outputs.shape[-1] - inputs["input_ids"].shape[-1]
+    # Every target forward verifies one round of drafts and adds one token of its own
+    accepted = max(new_tokens - target_calls[0], 0)
+    stats = {
+        "seconds": seconds,
+        "new_tokens": new_tokens,
+        "tokens_per_sec": new_tokens / seconds if seconds > 0 else 0.0,
+        "target_calls": target_calls[0],
+        "drafted": draft_calls[0],
+        "accepted": accepted,
+        "acceptance_rate": accepted / draft_calls[0] if draft_calls[0] else 0.0,
+    }
+    text = tokenizer.decode(outputs[0][inputs["input_ids"].shape[-1]:], skip_special_tokens=True)
+    return text, stats
+
+
+def translate_assisted(data_input):
+    """Translate with 1.5B quality at closer to 0.5B latency (assisted generation)."""
+    data = load_slide_data(data_input) if data_input != 0 else "Error: No text extracted from this slide."
+    if isinstance(data, str):
+        return data
+    try:
+        qwen_res, stats = _assisted_generate(data)
+    except Exception as e:
+        return f"Error: Generation failed: {e}"
+
+    for name in ASSISTED_STATS:
+        ASSISTED_STATS[name] += stats[name]
+    log_event("assisted.generate", **stats)
+    return prepare_response(qwen_res, data["en"])
+
+
+def compare_assisted(data_input):
+    """Run plain 1.5B greedy and assisted decoding on one slide and report the speed-up."""
+    data = load_slide_data(data_input)
+    if isinstance(data, str):
+        return data
+    plain_text, plain = _assisted_generate(data, use_draft=False)
+    assisted_text, assisted = _assisted_generate(data, use_draft=True)
+
+    report = {
+        "identical": plain_text == assisted_text,
+        "acceptance_rate": assisted["acceptance_rate"],
+        "plain_seconds": plain["seconds"],
+        "assisted_seconds": assisted["seconds"],
+        "speedup": plain["seconds"] / assisted["seconds"] if assisted["seconds"] > 0 else 0.0,
+    }
+    log_event("assisted.compare", **report)
+    return report
 
-    with torch.no_grad():
-        outputs = Lora.generate(
-        **inputs,
-        max_new_tokens=1024,
-        do_sample=False,
-        repetition_penalty=1.1
-        )
-    qwen_res = tokenizer.decode(outputs[0][inputs["input_ids"].shape[-1]:])
-    return prepare_response(qwen_res)
 
+def translate_deck(file_path, batch_size=8, adapter=None):
+    """Translate every slide of a .pptx file, returns one HTML (or error) per slide."""
+    from Processing_utils import process_single_slide, get_deck_index
 
+    slide_count = get_deck_index(file_path).slide_count
+    slides = [process_single_slide(file_path, n) for n in range(1, slide_count + 1)]
+    return translate_batch(slides, batch_size=batch_size, adapter=adapter)
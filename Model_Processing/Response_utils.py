@@ -0,0 +1,126 @@
+import re
+
+# Helpers for taking the model's HTML answer apart line by line and putting
+# it back together. "translated" is one <div dir="rtl"> with a <br> for every
+# newline of the English input; "explaining" is a run of
+# <div dir="rtl">TERM: ...</div> blocks.
+
+_OUTER_DIV = re.compile(r'^\s*<div[^>]*>(.*)</div>\s*$', re.DOTALL)
+_BR = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_TERM_BLOCK = re.compile(r'<div[^>]*>.*?</div>', re.DOTALL | re.IGNORECASE)
+_TAG = re.compile(r'<[^>]+>')
+
+
+def split_translated(translated):
+    """Return the <br>-separated segments of a "translated" value."""
+    match = _OUTER_DIV.match(translated or "")
+    inner = match.group(1) if match else (translated or "")
+    return [segment.strip() for segment in _BR.split(inner)]
+
+
+def join_translated(segments):
+    return '<div dir="rtl">' + "<br>".join(segments) + '</div>'
+
+
+def term_of(block):
+    """The English term a <div dir="rtl">TERM: ...</div> block explains."""
+    text = _TAG.sub("", block)
+    return text.split(":", 1)[0].strip()
+
+
+def split_explaining(explaining):
+    """Return [(term, block), ...] from an "explaining" value."""
+    if isinstance(explaining, list):
+        explaining = "".join(str(item) for item in explaining)
+    blocks = _TERM_BLOCK.findall(explaining or "")
+    return [(term_of(block), block) for block in blocks if term_of(block)]
+
+
+def merge_explaining(*explainings):
+    """Concatenate explaining values, keeping the first block for every term."""
+    seen = set()
+    merged = []
+    for explaining in explainings:
+        for term, block in split_explaining(explaining):
+            if term.lower() in seen:
+                continue
+            seen.add(term.lower())
+            merged.append(block)
+    return "".join(merged)
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+')
+
+
+def _pieces_of(line, count_tokens, max_tokens):
+    # A line over the budget is cut at sentence ends, then at word boundaries
+    if count_tokens(line) <= max_tokens:
+        return [line]
+    pieces = []
+    for sentence in _SENTENCE_END.split(line):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        # Every word is counted once, with the space in front of it (byte-level
+        # BPE tokenizes words separately), instead of re-counting the growing piece
+        current, used = [], 0
+        for word in sentence.split(" "):
+            cost = count_tokens(" " + word if current else word)
+            if current and used + cost > max_tokens:
+                pieces.append(" ".join(current))
+                current, used = [], count_tokens(word)
+            else:
+                used += cost
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_lines(lines, count_tokens, max_tokens):
+    """Group lines into chunks of at most max_tokens, breaking only between lines.
+
+    Returns [[(line_index, text), ...], ...]. A line that alone is over the
+    budget is split into several pieces that share its line_index, so
+    merge_chunks can put it back on one line.
+    """
+    chunks, current, used = [], [], 0
+    for index, line in enumerate(lines):
+        for piece in _pieces_of(line, count_tokens, max_tokens):
+            tokens = count_tokens(piece)
+            # +1 for the newline between two lines of a chunk; the first line has none
+            if current and used + 1 + tokens > max_tokens:
+                chunks.append(current)
+                current, used = [], 0
+            used += tokens + 1 if current else tokens
+            current.append((index, piece))
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_chunks(chunks, results):
+    """Merge the {translated, explaining} results of chunk_lines chunks into one.
+
+    When a chunk's answer has one <br> segment per input line, pieces of a
+    split line are joined back with a space so the <br> positions match the
+    original lines; otherwise the chunk's segments are kept as they are.
+    Glossary terms explained by several chunks are kept once.
+    """
+    segments = []
+    explainings = []
+    for chunk, result_text in zip(chunks, results):
+        parts = split_translated(result_text.get("translated", ""))
+        if len(parts) == len(chunk):
+            for (index, _), part in zip(chunk, parts):
+                if segments and segments[-1][0] == index:
+                    segments[-1] = (index, segments[-1][1] + " " + part)
+                else:
+                    segments.append((index, part))
+        else:
+            segments += [(None, part) for part in parts]
+        explainings.append(result_text.get("explaining", ""))
+    return {
+        "translated": join_translated([part for _, part in segments]),
+        "explaining": merge_explaining(*explainings),
+    }
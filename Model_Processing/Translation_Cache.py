@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+# Parsed {translated, explaining} results, keyed on the cleaned slide text,
+# the adapter and the generation parameters. Least recently used entries are
+# evicted once either cap is exceeded.
+CACHE_PATH = os.environ.get("TRANSLATOR_CACHE_PATH", os.path.join("cache", "translations.sqlite3"))
+MAX_ENTRIES = int(os.environ.get("TRANSLATOR_CACHE_MAX_ENTRIES", "10000"))
+MAX_BYTES = int(os.environ.get("TRANSLATOR_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+ENABLED = os.environ.get("TRANSLATOR_CACHE", "1") != "0"
+
+CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY,"
+            " result TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used)")
+        _conn.commit()
+    return _conn
+
+
+def _normalize(text):
+    # Only collapses whitespace, which is idempotent: the text was already
+    # cleaned by the caller, and clean_text run twice would also drop a
+    # trailing number that belongs to the slide ("released in 1991")
+    return "\n".join(" ".join(line.split()) for line in text.split("\n"))
+
+
+def make_key(text, adapter_id, generation_params):
+    payload = json.dumps(
+        {"text": _normalize(text), "adapter": adapter_id, "params": generation_params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """Return the cached result dict for key, or None."""
+    if not ENABLED:
+        return None
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT result FROM translations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            CACHE_STATS["misses"] += 1
+            return None
+        conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        CACHE_STATS["hits"] += 1
+    return json.loads(row[0])
+
+
+def put(key, result):
+    if not ENABLED:
+        return
+    data = json.dumps(result, ensure_ascii=False)
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO translations (key, result, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, data, len(data.encode("utf-8")), time.time()),
+        )
+        _evict(conn)
+        conn.commit()
+
+
+def _evict(conn):
+    count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM translations").fetchone()
+    if count <= MAX_ENTRIES and total <= MAX_BYTES:
+        return
+
+    removed = []
+    for key, size in conn.execute("SELECT key, size FROM translations ORDER BY last_used ASC"):
+        if count <= MAX_ENTRIES and total <= MAX_BYTES:
+            break
+        removed.append((key,))
+        count -= 1
+        total -= size
+    conn.executemany("DELETE FROM translations WHERE key = ?", removed)
+    CACHE_STATS["evictions"] += len(removed)
+
+
+def cache_stats():
+    with _lock:
+        count, total = _connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM translations").fetchone()
+    lookups = CACHE_STATS["hits"] + CACHE_STATS["misses"]
+    return dict(CACHE_STATS, entries=count, bytes=total, hit_rate=CACHE_STATS["hits"] / lookups if lookups else 0.0)
+
+
+def clear():
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM translations")
+        conn.commit()
@@ -0,0 +1,102 @@
+import os
+import re
+import sqlite3
+import threading
+from Model_Processing.Response_utils import split_translated, split_explaining
+
+# Line-level translation memory: every English line of a slide whose
+# translation came back with a matching number of <br> segments is stored with
+# its Arabic segment, plus every explained term. Slides made only of known
+# lines are assembled without the model; partly known slides only send their
+# unknown lines.
+MEMORY_PATH = os.environ.get("TRANSLATOR_MEMORY_PATH", os.path.join("cache", "translation_memory.sqlite3"))
+ENABLED = os.environ.get("TRANSLATOR_MEMORY", "1") != "0"
+
+MEMORY_STATS = {"lines_reused": 0, "lines_sent": 0, "slides_assembled": 0}
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        directory = os.path.dirname(MEMORY_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _conn = sqlite3.connect(MEMORY_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " adapter TEXT NOT NULL, line TEXT NOT NULL, translation TEXT NOT NULL,"
+            " PRIMARY KEY (adapter, line))"
+        )
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS terms ("
+            " adapter TEXT NOT NULL, term TEXT NOT NULL, block TEXT NOT NULL,"
+            " PRIMARY KEY (adapter, term))"
+        )
+        _conn.commit()
+    return _conn
+
+
+def learn(en_text, result, adapter_id):
+    """Store the line pairs and term explanations of one parsed model result."""
+    if not ENABLED:
+        return False
+    lines = en_text.split("\n")
+    segments = split_translated(result.get("translated", ""))
+    aligned = len(lines) == len(segments) and all(segments)
+
+    with _lock:
+        conn = _connect()
+        if aligned:
+            conn.executemany(
+                "INSERT OR REPLACE INTO segments (adapter, line, translation) VALUES (?, ?, ?)",
+                [(adapter_id, line, segment) for line, segment in zip(lines, segments)],
+            )
+        conn.executemany(
+            "INSERT OR IGNORE INTO terms (adapter, term, block) VALUES (?, ?, ?)",
+            [(adapter_id, term.lower(), block) for term, block in split_explaining(result.get("explaining", ""))],
+        )
+        conn.commit()
+    return aligned
+
+
+def lookup(lines, adapter_id):
+    """Return {line: translated segment} for the lines already in memory."""
+    if not ENABLED or not lines:
+        return {}
+    unique = list(dict.fromkeys(lines))
+    known = {}
+    with _lock:
+        conn = _connect()
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT line, translation FROM segments WHERE adapter = ? AND line IN ({placeholders})",
+                [adapter_id] + chunk,
+            )
+            known.update(rows.fetchall())
+    return known
+
+
+def explaining_for(text, adapter_id):
+    """Stored explanation blocks for the terms that occur in text."""
+    if not ENABLED:
+        return ""
+    lowered = text.lower()
+    with _lock:
+        rows = _connect().execute("SELECT term, block FROM terms WHERE adapter = ?", (adapter_id,)).fetchall()
+    return "".join(
+        block for term, block in rows
+        if re.search(r'(?<!\w)' + re.escape(term) + r'(?!\w)', lowered)
+    )
+
+
+def all_terms():
+    """Every stored (term, block) pair, for building the glossary (Glossary.py)."""
+    with _lock:
+        return _connect().execute("SELECT term, block FROM terms ORDER BY rowid").fetchall()
@@ -2,10 +2,29 @@ import json
 import os
 import re
 import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import OrderedDict
 from pptx import Presentation
-import pdfkit
+from Metrics_utils import span, timed
 
-PATH_WKHTMLTOPDF = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
+# WeasyPrint renders in-process; wkhtmltopdf (through pdfkit) is only the
+# fallback when WeasyPrint is not installed.
+try:
+    from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+except (ImportError, OSError):
+    # OSError: the package is installed but the Pango/Cairo libraries are not
+    HTML = None
+
+try:
+    import pdfkit
+except ImportError:
+    pdfkit = None
+
+PATH_WKHTMLTOPDF = os.environ.get("WKHTMLTOPDF_PATH", r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
 
 #################################################
 #clean part
@@ -26,6 +45,102 @@ def clean_text(text):
 
     return "\n".join(cleaned_lines)
 ######################################################
+#DeckIndex (parse a presentation once)
+#####################################################
+
+def extract_slide_text(slide):
+    text_shapes = []
+    for shape in slide.shapes:
+        if not shape.has_text_frame:
+            continue
+        text_shapes.append(shape)
+    text_shapes.sort(key=lambda x: (x.top, x.left))
+
+    slide_text_content = []
+    for shape in text_shapes:
+        for paragraph in shape.text_frame.paragraphs:
+            text = paragraph.text.strip()
+            if text:
+                slide_text_content.append(text)
+
+    return clean_text("\n".join(slide_text_content))
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DeckIndex:
+    """A .pptx parsed once, with the cleaned text of each slide extracted on demand.
+
+    Slide numbers are 1-based, like the user input.
+    """
+
+    def __init__(self, file_path, digest=None):
+        self.file_path = file_path
+        self.file_hash = digest or file_hash(file_path)
+        self._prs = None
+        self._texts = {}
+        self._lock = threading.RLock()
+
+    @property
+    def presentation(self):
+        with self._lock:
+            if self._prs is None:
+                with span("pptx_parse"):
+                    self._prs = Presentation(self.file_path)
+            return self._prs
+
+    @property
+    def slide_count(self):
+        return len(self.presentation.slides)
+
+    def slide_text(self, slide_number):
+        with self._lock:
+            if slide_number not in self._texts:
+                slide = self.presentation.slides[slide_number - 1]
+                self._texts[slide_number] = extract_slide_text(slide)
+            return self._texts[slide_number]
+
+    def iter_slides(self):
+        for slide_number in range(1, self.slide_count + 1):
+            yield slide_number, self.slide_text(slide_number)
+
+
+# Recently used decks. Each is found by (path, mtime, size) without reading
+# the file, or by content hash, so re-uploads of the same deck reuse the parse.
+MAX_CACHED_DECKS = 16
+_decks_by_hash = OrderedDict()
+_hash_by_stat = {}
+_decks_lock = threading.Lock()
+
+
+def get_deck_index(file_path):
+    stat = os.stat(file_path)
+    stat_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    with _decks_lock:
+        digest = _hash_by_stat.get(stat_key)
+        if digest is None:
+            digest = file_hash(file_path)
+            _hash_by_stat[stat_key] = digest
+
+        deck = _decks_by_hash.get(digest)
+        if deck is None:
+            deck = DeckIndex(file_path, digest)
+            _decks_by_hash[digest] = deck
+            while len(_decks_by_hash) > MAX_CACHED_DECKS:
+                evicted, _ = _decks_by_hash.popitem(last=False)
+                for key in [k for k, v in _hash_by_stat.items() if v == evicted]:
+                    del _hash_by_stat[key]
+        _decks_by_hash.move_to_end(digest)
+    return deck
+
+######################################################
 #process_all_pptx
 #####################################################
 
@@ -37,32 +152,13 @@ def process_all_pptx(folder_path, output_json_path):
     for filename in files:
         file_path = os.path.join(folder_path, filename)
         try:
-            prs = Presentation(file_path)
+            deck = DeckIndex(file_path)
+            slides = list(deck.iter_slides())
         except Exception as e:
             print(f"Error reading {filename}: {e}")
             continue
 
-        for slide_index, slide in enumerate(prs.slides):
-            text_shapes = []
-            for shape in slide.shapes:
-                if not shape.has_text_frame:
-                    continue
-                text_shapes.append(shape)
-            text_shapes.sort(key=lambda x: (x.top, x.left))
-            slide_text_content = []
-
-            for shape in text_shapes:
-                for paragraph in shape.text_frame.paragraphs:
-                    text = paragraph.text.strip()
-                    if text:
-                        slide_text_content.append(text)
-
-            full_text = "\n".join(slide_text_content)
-
-
-            cleaned_text = clean_text(full_text)
-
-
+        for slide_number, cleaned_text in slides:
             if len(cleaned_text.split()) >= 10:
                 entry = {
                     "en": cleaned_text,
@@ -73,10 +169,242 @@ def process_all_pptx(folder_path, output_json_path):
         json.dump(all_samples, f, ensure_ascii=False, indent=4)
 #process_all_pptx(r"C:\Users\User\OneDrive\DA350P\files3", r"C:\Users\User\OneDrive\DA350P\training_dataset3.json")
 
+######################################################
+#stream_all_pptx (parallel, resumable, JSONL output)
+#####################################################
+
+def _extract_deck_samples(file_path, min_words):
+    # Runs in a worker process
+    start = time.perf_counter()
+    deck = DeckIndex(file_path)
+    samples = [
+        {"en": cleaned_text, "target": ""}
+        for _, cleaned_text in deck.iter_slides()
+        if len(cleaned_text.split()) >= min_words
+    ]
+    return samples, time.perf_counter() - start
+
+
+def _read_manifest(manifest_path):
+    """Manifest records; a torn last line from a crash is cut off (that deck is simply redone)."""
+    records = []
+    if not os.path.exists(manifest_path):
+        return records
+    good_offset = 0
+    with open(manifest_path, 'rb') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                break
+            good_offset += len(line)
+    # Otherwise the next record would be appended onto the fragment
+    with open(manifest_path, 'r+b') as f:
+        f.truncate(good_offset)
+    return records
+
+
+def stream_all_pptx(folder_path, output_jsonl_path, manifest_path=None, workers=None, min_words=10):
+    """Extract training samples from every deck in folder_path using a process pool.
+
+    Samples are appended to output_jsonl_path as each deck finishes. Every
+    finished deck is recorded in the manifest (default: <output>.manifest.jsonl)
+    with its sample count, timing and the JSONL offset after its samples, so a
+    rerun skips recorded decks and first cuts off anything written after the
+    last recorded offset. Decks that failed are recorded with "error" and
+    tried again on the next run.
+    """
+    manifest_path = manifest_path or output_jsonl_path + ".manifest.jsonl"
+    records = _read_manifest(manifest_path)
+    # The latest record of a deck counts, so a failure followed by a success is done
+    latest = {record["file"]: record for record in records}
+    done = {filename for filename, record in latest.items() if "error" not in record}
+
+    # Drop samples from a deck that was written but never recorded
+    if os.path.exists(output_jsonl_path):
+        offset = records[-1]["offset"] if records else 0
+        with open(output_jsonl_path, 'r+b') as f:
+            f.truncate(offset)
+
+    files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.pptx') and f not in done)
+    print(f"{len(done)} decks already extracted, {len(files)} to go")
+
+    start = time.perf_counter()
+    total_samples = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(output_jsonl_path, 'a', encoding='utf-8') as out, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest:
+        futures = {
+            pool.submit(_extract_deck_samples, os.path.join(folder_path, filename), min_words): filename
+            for filename in files
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            record = {"file": filename}
+            try:
+                samples, seconds = future.result()
+            except Exception as e:
+                print(f"Error reading {filename}: {e}")
+                samples, seconds = [], 0.0
+                record["error"] = str(e)
+
+            for sample in samples:
+                out.write(json.dumps(sample, ensure_ascii=False) + "\n")
+            out.flush()
+            total_samples += len(samples)
+
+            record.update(samples=len(samples), seconds=round(seconds, 3), offset=out.tell())
+            manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+            manifest.flush()
+            print(f"{filename}: {len(samples)} samples in {seconds:.2f}s")
+
+    elapsed = time.perf_counter() - start
+    print(f"Extracted {total_samples} samples from {len(files)} decks in {elapsed:.1f}s")
+    return total_samples
+#stream_all_pptx(r"C:\Users\User\OneDrive\DA350P\files3", r"C:\Users\User\OneDrive\DA350P\training_dataset3.jsonl", workers=8)
+
+######################################################
+#near-duplicate filtering (MinHash + LSH)
+#####################################################
+# Course decks reuse slides, so the extracted samples contain many
+# near-identical texts. Every sample gets a MinHash signature of its word
+# 5-grams; LSH banding finds candidate pairs, and pairs whose estimated
+# Jaccard similarity reaches the threshold are merged into one cluster.
+DEDUPE_THRESHOLD = 0.8
+MINHASH_PERMUTATIONS = 128
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _shingles(text, size=SHINGLE_SIZE):
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(text, permutations):
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+              for s in _shingles(text)]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in permutations)
+
+
+def _lsh_bands(threshold, num_perm):
+    # bands * rows = num_perm; pairs become candidates around (1/bands)^(1/rows).
+    # Candidates are verified afterwards, so prefer a point just below the threshold.
+    def point(option):
+        return (1.0 / option[0]) ** (1.0 / option[1])
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [option for option in options if point(option) <= threshold]
+    return max(below, key=point) if below else min(options, key=point)
+
+
+def dedupe_samples(samples, threshold=DEDUPE_THRESHOLD, num_perm=MINHASH_PERMUTATIONS, seed=1):
+    """Return (kept_samples, clusters) with one sample kept per near-duplicate cluster.
+
+    The longest text of a cluster is kept, so no slide content is lost.
+    clusters is [{"kept": index, "duplicates": [(index, similarity), ...]}, ...]
+    with indexes into samples.
+    """
+    rng = random.Random(seed)
+    permutations = [(rng.randrange(1, 1 << 32), rng.randrange(0, 1 << 32)) for _ in range(num_perm)]
+    signatures = [minhash_signature(sample["en"], permutations) for sample in samples]
+
+    bands, rows = _lsh_bands(threshold, num_perm)
+    parent = list(range(len(samples)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    similarity = {}
+    for band in range(bands):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            buckets.setdefault(signature[band * rows:(band + 1) * rows], []).append(i)
+        for members in buckets.values():
+            for position, j in enumerate(members):
+                for i in members[:position]:
+                    if find(i) == find(j):
+                        break
+                    if (i, j) not in similarity:
+                        similarity[(i, j)] = sum(x == y for x, y in zip(signatures[i], signatures[j])) / num_perm
+                    if similarity[(i, j)] >= threshold:
+                        parent[find(j)] = find(i)
+                        break
+
+    groups = {}
+    for i in range(len(samples)):
+        groups.setdefault(find(i), []).append(i)
+
+    kept, clusters = [], []
+    for members in groups.values():
+        best = max(members, key=lambda i: (len(samples[i]["en"]), -i))
+        kept.append(best)
+        if len(members) > 1:
+            duplicates = [
+                (i, sum(x == y for x, y in zip(signatures[best], signatures[i])) / num_perm)
+                for i in members if i != best
+            ]
+            clusters.append({"kept": best, "duplicates": duplicates})
+    kept.sort()
+    return [samples[i] for i in kept], clusters
+
+
+def _load_samples(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def dedupe_dataset(input_path, output_path, report_path=None, threshold=DEDUPE_THRESHOLD):
+    """Deduplicate a .json / .jsonl sample file and write a cluster report next to it."""
+    samples = _load_samples(input_path)
+    start = time.perf_counter()
+    kept, clusters = dedupe_samples(samples, threshold=threshold)
+    elapsed = time.perf_counter() - start
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        if output_path.endswith(".jsonl"):
+            for sample in kept:
+                f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+        else:
+            json.dump(kept, f, ensure_ascii=False, indent=4)
+
+    report_path = report_path or os.path.splitext(output_path)[0] + ".clusters.json"
+    report = {
+        "input": input_path,
+        "threshold": threshold,
+        "samples": len(samples),
+        "kept": len(kept),
+        "removed": len(samples) - len(kept),
+        "clusters": [
+            {
+                "kept": {"index": cluster["kept"], "en": samples[cluster["kept"]]["en"][:200]},
+                "duplicates": [
+                    {"index": i, "similarity": round(s, 3), "en": samples[i]["en"][:200]}
+                    for i, s in sorted(cluster["duplicates"], key=lambda d: -d[1])
+                ],
+            }
+            for cluster in sorted(clusters, key=lambda c: -len(c["duplicates"]))
+        ],
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+    print(f"Kept {len(kept)} of {len(samples)} samples ({len(clusters)} duplicate clusters) in {elapsed:.1f}s")
+    return len(kept), len(clusters)
+#dedupe_dataset(r"C:\Users\User\OneDrive\DA350P\training_dataset3.jsonl", r"C:\Users\User\OneDrive\DA350P\training_dataset3_dedup.json", threshold=0.8)
+
 ####################################################
 #validate_input_file
 ###################################################
 
+@timed("validate")
 def validate_input_file(file_path, slide_number):
     #Check if file exists
     if not os.path.exists(file_path):
@@ -91,8 +419,11 @@ def validate_input_file(file_path, slide_number):
     if not isinstance(slide_number, int) or slide_number <= 0:
         return 0
     #Check slide number bounds
-    prs=Presentation(file_path)
-    if slide_number > len(prs.slides):
+    try:
+        slide_count = get_deck_index(file_path).slide_count
+    except Exception:
+        return 0
+    if slide_number > slide_count:
             return 0
     
     
@@ -101,27 +432,13 @@ def validate_input_file(file_path, slide_number):
 #extract text from specific slides
 ################################################
 
+@timed("extract")
 def process_single_slide(file_path, slide_number):
-    # Convert User Input (1) to Python Index (0)
-    slide_index = slide_number - 1
     try:
-        prs = Presentation(file_path)
-        if slide_index < 0 or slide_index >= len(prs.slides): return 0
-        
-        slide = prs.slides[slide_index]
-        text_shapes = []
-        for shape in slide.shapes:
-            if not shape.has_text_frame: continue
-            text_shapes.append(shape)
-        text_shapes.sort(key=lambda x: (x.top, x.left))
-        
-        slide_text_content = []
-        for shape in text_shapes:
-            for paragraph in shape.text_frame.paragraphs:
-                text = paragraph.text.strip()
-                if text: slide_text_content.append(text)
-                
-        cleaned_text = clean_text("\n".join(slide_text_content))
+        deck = get_deck_index(file_path)
+        if slide_number < 1 or slide_number > deck.slide_count: return 0
+
+        cleaned_text = deck.slide_text(slide_number)
         
         if len(cleaned_text.split()) < 20: return 0
         
@@ -131,43 +448,186 @@ def process_single_slide(file_path, slide_number):
 ########################################################
 #HTML_TO_PDF
 #######################################################
-def render_pdf_from_html_strings(html_text, output_pdf_path):
-    if not os.path.exists(PATH_WKHTMLTOPDF):
-        print(f"CRITICAL ERROR: wkhtmltopdf not found at {PATH_WKHTMLTOPDF}")
-        print("Please install it from https://wkhtmltopdf.org/downloads.html")
-        return False
+# Shared by every rendered page; mirrors the <style> of Model_Using.build_html
+SLIDE_CSS = """
+@page { size: A4; margin: 1in; }
+body { font-family: 'Arial', sans-serif; font-size: 14pt; line-height: 1.8; direction: rtl; text-align: right; }
+.container { width: 100%; margin-bottom: 30px; }
+.header { background-color: #2980b9; color: white; padding: 10px; border-radius: 5px; margin-bottom: 15px; font-weight: bold; }
+.content { text-align: justify; background-color: #f8f9fa; padding: 15px; border: 1px solid #ddd; border-radius: 5px; }
+span[dir='ltr'] { direction: ltr; unicode-bidi: embed; font-family: sans-serif; font-weight: bold; color: #c0392b; }
+.slide { break-before: page; page-break-before: always; }
+body > .slide:first-child { break-before: auto; page-break-before: auto; }
+.slide-title { color: #2c3e50; border-bottom: 2px solid #2980b9; }
+.toc a { color: #2c3e50; text-decoration: none; }
+.toc a::after { content: leader('.') target-counter(attr(href), page); }
+.toc a[data-page]::after { content: leader('.') attr(data-page); }
+"""
 
-    # Ensure input is a string
-    if not isinstance(html_text, str):
-        html_text = str(html_text)
+_weasy_resources = None
+_weasy_lock = threading.Lock()
 
-    # Wrap in HTML if missing
-    if "<html" not in html_text:
-        full_html = f"""
+
+def _get_weasy_resources():
+    # FontConfiguration scans the system fonts and CSS() parses the
+    # stylesheet; both are done once per process instead of once per PDF
+    global _weasy_resources
+    with _weasy_lock:
+        if _weasy_resources is None:
+            font_config = FontConfiguration()
+            stylesheet = CSS(string=SLIDE_CSS, font_config=font_config)
+            _weasy_resources = (font_config, stylesheet)
+        return _weasy_resources
+
+
+def _wrap_html(body):
+    return f"""
         <!DOCTYPE html>
         <html dir="rtl" lang="ar">
         <head>
             <meta charset="UTF-8">
             <style>body {{ font-family: Arial, sans-serif; direction: rtl; text-align: right; }}</style>
         </head>
-        <body>{html_text}</body>
+        <body>{body}</body>
         </html>
         """
-    else:
-        full_html = html_text
+
+
+def _body_of(html_text):
+    match = re.search(r'<body[^>]*>(.*)</body>', html_text, re.DOTALL | re.IGNORECASE)
+    return match.group(1) if match else html_text
+
+
+def _write_pdf(full_html, output_pdf_path):
+    if HTML is not None:
+        font_config, stylesheet = _get_weasy_resources()
+        HTML(string=full_html).write_pdf(output_pdf_path, stylesheets=[stylesheet], font_config=font_config)
+        return True
+
+    if pdfkit is None or not os.path.exists(PATH_WKHTMLTOPDF):
+        print(f"CRITICAL ERROR: WeasyPrint is not installed and wkhtmltopdf was not found at {PATH_WKHTMLTOPDF}")
+        print("Please run `pip install weasyprint` or install https://wkhtmltopdf.org/downloads.html")
+        return False
+
+    config = pdfkit.configuration(wkhtmltopdf=PATH_WKHTMLTOPDF)
+    options = {
+        'encoding': "UTF-8",
+        'no-outline': None,
+        'enable-local-file-access': None
+    }
+    pdfkit.from_string(full_html, output_pdf_path, configuration=config, options=options)
+    return True
+
+
+@timed("render")
+def render_pdf_from_html_strings(html_text, output_pdf_path):
+    # Ensure input is a string
+    if not isinstance(html_text, str):
+        html_text = str(html_text)
+
+    # Wrap in HTML if missing
+    full_html = html_text if "<html" in html_text else _wrap_html(html_text)
 
     try:
-        config = pdfkit.configuration(wkhtmltopdf=PATH_WKHTMLTOPDF)
-        
-        options = {
-            'encoding': "UTF-8",
-            'no-outline': None,
-            'enable-local-file-access': None
-        }
-        
-        pdfkit.from_string(full_html, output_pdf_path, configuration=config, options=options)
+        return _write_pdf(full_html, output_pdf_path)
+    except Exception as e:
+        print(f"PDF Generation Error: {e}")
+        return False
+
+
+def _is_renderable(html_text):
+    return isinstance(html_text, str) and not html_text.startswith("Error")
+
+
+def _slide_section(index, title, html_text):
+    return f'<section class="slide" id="slide-{index + 1}"><h2 class="slide-title">{title}</h2>{_body_of(html_text)}</section>'
+
+
+def _toc_html(entries):
+    return f'<nav class="toc"><h1>المحتويات (Contents)</h1><ol>{"".join(entries)}</ol></nav>'
+
+
+def _document_html(body):
+    return f"""<!DOCTYPE html>
+<html lang="ar" dir="rtl">
+<head><meta charset="UTF-8"><style>{SLIDE_CSS}</style></head>
+<body>{body}</body>
+</html>
+"""
+
+
+def build_document_html(html_slides, titles=None, toc=False):
+    """Combine per-slide HTML into one document, one slide per page.
+
+    Slides whose value is not HTML (e.g. "Error: ..." strings) are skipped.
+    """
+    sections = []
+    entries = []
+    for i, html_text in enumerate(html_slides):
+        if not _is_renderable(html_text):
+            continue
+        title = titles[i] if titles else f"Slide {i + 1}"
+        entries.append(f'<li><a href="#slide-{i + 1}">{title}</a></li>')
+        sections.append(_slide_section(i, title, html_text))
+
+    toc_html = _toc_html(entries) if toc and entries else ""
+    return _document_html(toc_html + "".join(sections))
+
+
+@timed("render")
+def render_pdf_document(html_slides, output_pdf_path, titles=None, toc=False):
+    """Render many slide HTML strings into one PDF in a single pass."""
+    if not any(isinstance(h, str) and not h.startswith("Error") for h in html_slides):
+        print("PDF Generation Error: no slide could be rendered")
+        return False
+    try:
+        return _write_pdf(build_document_html(html_slides, titles=titles, toc=toc), output_pdf_path)
+    except Exception as e:
+        print(f"PDF Generation Error: {e}")
+        return False
+
+# Incremental rendering for the deck pipeline (workflow.py): every slide is
+# laid out as soon as its translation arrives, while the model works on the
+# next ones, and the finished pages are only stitched together at the end.
+
+def layout_slide(html_text, index, title):
+    """WeasyPrint layout of one slide (its pages keep the slide-N anchor); None if it cannot be laid out."""
+    if HTML is None or not _is_renderable(html_text):
+        return None
+    font_config, stylesheet = _get_weasy_resources()
+    html = _document_html(_slide_section(index, title, html_text))
+    return HTML(string=html).render(stylesheets=[stylesheet], font_config=font_config)
+
+
+def _layout_toc(entries, first_page):
+    # Page numbers are written out, since the slides are laid out separately
+    font_config, stylesheet = _get_weasy_resources()
+    items = [f'<li><a href="#slide-{index + 1}" data-page="{first_page + offset}">{title}</a></li>'
+             for index, title, offset in entries]
+    return HTML(string=_document_html(_toc_html(items))).render(stylesheets=[stylesheet], font_config=font_config)
+
+
+@timed("render")
+def write_laid_out_document(layouts, output_pdf_path, titles, toc=False):
+    """Write the pages from layout_slide (one entry per slide, None = skipped) as one PDF."""
+    slides = [(i, layout) for i, layout in enumerate(layouts) if layout is not None]
+    if not slides:
+        print("PDF Generation Error: no slide could be rendered")
+        return False
+    try:
+        pages = [page for _, layout in slides for page in layout.pages]
+        if toc:
+            entries, offset = [], 0
+            for i, layout in slides:
+                entries.append((i, titles[i], offset))
+                offset += len(layout.pages)
+            toc_layout = _layout_toc(entries, 2)
+            if len(toc_layout.pages) != 1:
+                # A long contents list takes several pages and shifts every number
+                toc_layout = _layout_toc(entries, len(toc_layout.pages) + 1)
+            pages = toc_layout.pages + pages
+        slides[0][1].copy(pages).write_pdf(output_pdf_path)
         return True
-        
     except Exception as e:
         print(f"PDF Generation Error: {e}")
         return False
@@ -1,10 +1,13 @@
 import streamlit as st
 import os
+import time
+import uuid
 import streamlit.components.v1 as components
 
 # Import the functions from your pipeline
-from Processing_utils import validate_input_file, process_single_slide, render_pdf_from_html_strings, generate_unique_output_path
-from Model_Processing.Model_Using import translate_and_generate_html
+from Processing_utils import validate_input_file
+from job_queue import submit_job, get_job, queue_position, ensure_worker
+from Model_Processing.Adapter_Registry import adapter_names, DEFAULT_ADAPTER
 
 # --- 1. PAGE CONFIGURATION (Arabic Support) ---
 st.set_page_config(
@@ -13,6 +16,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# The model lives in a separate worker process, started once for all sessions
+ensure_worker()
+
 # Custom CSS to force Right-to-Left (RTL) layout for Arabic
 st.markdown("""
     <style>
@@ -35,52 +41,67 @@ with st.sidebar:
     st.header("إعدادات الملف")
     uploaded_file = st.file_uploader("📂 اختر ملف العرض التقديمي (PPTX)", type=["pptx"])
     slide_number = st.number_input("🔢 رقم الشريحة المراد ترجمتها", min_value=1, value=1)
+    whole_deck = st.checkbox("📚 ترجمة العرض كاملاً (ملف PDF واحد)", value=False)
+    # Every adapter runs on the worker's one base model; switching costs no reload
+    adapters = adapter_names()
+    adapter = st.selectbox("🧠 نموذج الترجمة (Adapter)", adapters, index=adapters.index(DEFAULT_ADAPTER))
     
     st.info("💡 ملاحظة: تأكد من أن الشريحة تحتوي على نص تقني باللغة الإنجليزية.")
 
 # --- 4. MAIN PROCESSING ---
+# The work runs in the background worker; this script only submits the job
+# and then polls its status, so the page never blocks on the model.
 if uploaded_file and st.button("🚀 بدء الترجمة"):
     
     # A. Save the file temporarily
     os.makedirs("inputs", exist_ok=True)
-    temp_path = os.path.join("inputs", uploaded_file.name)
+    temp_path = os.path.join("inputs", f"{uuid.uuid4().hex}_{uploaded_file.name}")
     with open(temp_path, "wb") as f:
         f.write(uploaded_file.getbuffer())
 
-    # B. Validation
-    with st.status("جاري معالجة البيانات...", expanded=True) as status:
-        
-        st.write("1️⃣ التحقق من الملف...")
-        if not validate_input_file(temp_path, slide_number):
-            status.update(label="خطأ في الملف!", state="error")
-            st.error("❌ الملف غير صالح أو رقم الشريحة غير موجود.")
-            st.stop()
-            
-        st.write("2️⃣ استخراج النصوص...")
-        slides_text = process_single_slide(temp_path, slide_number)
-        if slides_text == 0:
-            status.update(label="فشل الاستخراج!", state="error")
-            st.error("❌ لم يتم العثور على نص كافٍ في هذه الشريحة.")
-            st.stop()
-
-        st.write("3️⃣ الذكاء الاصطناعي يترجم ويشرح (قد يستغرق وقتاً)...")
-        # Generate the HTML Content
-        html_result = translate_and_generate_html(slides_text)
-        
-        # Check for errors in model output
-        if not isinstance(html_result, str) or "Error" in html_result:
-             status.update(label="خطأ في النموذج!", state="error")
-             st.error("❌ حدث خطأ أثناء الترجمة.")
-             st.stop()
-
-        st.write("4️⃣ إنشاء ملف PDF...")
-        output_pdf_path = generate_unique_output_path(temp_path, slide_number)
-        pdf_success = render_pdf_from_html_strings(html_result, output_pdf_path)
-        
-        if pdf_success:
-            status.update(label="✅ تمت العملية بنجاح!", state="complete")
-        else:
-            status.update(label="⚠️ تم العرض ولكن فشل حفظ PDF", state="warning")
+    # B. Validation (cheap, no model needed); a whole deck only needs one slide,
+    # whatever number is left in the slide box
+    if not validate_input_file(temp_path, 1 if whole_deck else slide_number):
+        st.error("❌ الملف غير صالح أو رقم الشريحة غير موجود.")
+        st.stop()
+
+    st.session_state["job_id"] = submit_job(temp_path, None if whole_deck else slide_number, adapter)
+
+job_id = st.session_state.get("job_id")
+if job_id:
+    job = get_job(job_id)
+    stage_labels = {
+        "validate": "1️⃣ التحقق من الملف...",
+        "extract": "2️⃣ استخراج النصوص...",
+        "translate": "3️⃣ الذكاء الاصطناعي يترجم ويشرح (قد يستغرق وقتاً)...",
+        "render": "4️⃣ إنشاء ملف PDF...",
+    }
+
+    if job["status"] in ("queued", "running"):
+        with st.status("جاري معالجة البيانات...", expanded=True):
+            if job["status"] == "queued":
+                st.write(f"⏳ في الانتظار ({queue_position(job_id)} قبلك)")
+            else:
+                st.write(stage_labels.get(job["stage"], "..."))
+            st.progress(job["progress"])
+            detail = job["detail"]
+            if job["stage"] == "translate" and detail:
+                st.caption(f"⚡ {detail['tokens']} tokens — {detail['tokens_per_sec']:.1f} tokens/sec")
+                st.code(detail["text"], language="json")
+        time.sleep(1)
+        st.rerun()
+
+    if job["status"] == "failed":
+        st.session_state.pop("job_id", None)
+        st.error(f"❌ حدث خطأ أثناء الترجمة: {job['error']}")
+        st.stop()
+
+    st.session_state.pop("job_id", None)
+    output_pdf_path = job["result_path"]
+    html_result = (job["detail"] or {}).get("html") or ""
+    if isinstance(html_result, list):
+        # Whole deck: preview every translated slide one after another
+        html_result = "<hr>".join(h for h in html_result if isinstance(h, str) and not h.startswith("Error"))
 
     # --- 5. DISPLAY RESULTS (Show Translation & Explanation) ---
     st.divider()
@@ -0,0 +1,353 @@
+"""End-to-end pipeline benchmark.
+
+Replays samples of full_json2.json through extraction, translation and PDF
+rendering, then runs synthetic .pptx decks through the whole-deck workflow
+(all three stages together), and writes the numbers to a JSON
+file that later runs can be compared against.
+
+By default a tiny randomly initialised Qwen2 model with a tokenizer trained
+on the samples is used, so the benchmark runs offline on CPU (CI). Its
+translations are garbage, but the latency of every stage is real. Use
+--real to benchmark the configured model instead.
+
+    python benchmarks/bench_pipeline.py --out bench_results.json
+    python benchmarks/bench_pipeline.py --out new.json --baseline bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import tempfile
+try:
+    import resource
+except ImportError:
+    # Windows: peak memory comes from psutil instead
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from pptx import Presentation
+from pptx.util import Inches
+
+import Processing_utils
+from Processing_utils import DeckIndex, render_pdf_from_html_strings, render_pdf_document
+from Model_Processing import Model_Using, Translation_Cache, Translation_Memory
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "full_json2.json")
+
+QWEN_CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{'<|im_start|>' + message['role'] + '\\n' + message['content'] + '<|im_end|>' + '\\n'}}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|im_start|>assistant\\n' }}{% endif %}"
+)
+
+################################################
+#tiny offline model
+################################################
+
+def build_tiny_model(texts, vocab_size=2000, seed=0):
+    """A byte-level BPE tokenizer trained on texts and a 2-layer random Qwen2."""
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+    from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+
+    special = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=special,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    backend.train_from_iterator(texts + [Model_Using.system_instruction], trainer=trainer)
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        eos_token="<|im_end|>",
+        pad_token="<|endoftext|>",
+    )
+    tokenizer.chat_template = QWEN_CHAT_TEMPLATE
+
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        tie_word_embeddings=True,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model = Qwen2ForCausalLM(config).to(Model_Using.device).eval()
+    return tokenizer, model
+
+################################################
+#helpers
+################################################
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None when it cannot be read."""
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and KiB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024.0
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    # peak_wset is the Windows peak working set; elsewhere only the current RSS is known
+    return getattr(info, "peak_wset", info.rss) / 2 ** 20
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def make_decks(samples, folder, decks, slides_per_deck):
+    paths = []
+    for d in range(decks):
+        prs = Presentation()
+        for s in range(slides_per_deck):
+            sample = samples[(d * slides_per_deck + s) % len(samples)]
+            slide = prs.slides.add_slide(prs.slide_layouts[5])
+            lines = sample["en"].split("\n")
+            slide.shapes.title.text = lines[0]
+            body = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(5))
+            body.text_frame.text = "\n".join(lines[1:])
+        path = os.path.join(folder, f"deck_{d}.pptx")
+        prs.save(path)
+        paths.append(path)
+    return paths
+
+################################################
+#stages
+################################################
+
+def bench_extraction(deck_paths):
+    per_slide = []
+    per_deck = []
+    for path in deck_paths:
+        start = time.perf_counter()
+        deck = DeckIndex(path)
+        slides = list(deck.iter_slides())
+        elapsed = time.perf_counter() - start
+        per_deck.append(elapsed)
+        per_slide.append(elapsed / max(len(slides), 1))
+    return {"per_deck_seconds": summarize(per_deck), "per_slide_seconds": summarize(per_slide)}
+
+
+def bench_decks(deck_paths, batch_size):
+    """The synthetic decks through the whole-deck workflow: extract, translate, render."""
+    import workflow
+    per_deck, per_slide, utilisation = [], [], {}
+    error = None
+    for path in deck_paths:
+        slides = DeckIndex(path).slide_count
+        start = time.perf_counter()
+        try:
+            output_pdf_path = workflow.process_deck_translation(path, batch_size=batch_size)
+        except RuntimeError as e:
+            # No PDF renderer installed, like bench_rendering's succeeded=False
+            error = str(e)
+            continue
+        elapsed = time.perf_counter() - start
+        per_deck.append(elapsed)
+        per_slide.append(elapsed / max(slides, 1))
+        for name, value in workflow.PIPELINE_STATS.items():
+            if name.endswith("_utilisation"):
+                utilisation.setdefault(name, []).append(value)
+        # The workflow writes to outputs/; the benchmark keeps nothing
+        os.remove(output_pdf_path)
+    return {
+        "succeeded": error is None,
+        "error": error,
+        "per_deck_seconds": summarize(per_deck),
+        "per_slide_seconds": summarize(per_slide),
+        **{name: summarize(values) for name, values in utilisation.items()},
+    }
+
+
+def bench_tokens_per_sec(samples, max_new_tokens):
+    tokenizer, model = Model_Using.get_model()
+    prefill, decode = [], []
+    for sample in samples:
+        ids = Model_Using.prompt_ids(tokenizer, Model_Using.build_messages(sample))
+        input_ids = torch.tensor([ids], device=Model_Using.device)
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            model(input_ids=input_ids)
+        prefill_seconds = time.perf_counter() - start
+        prefill.append(len(ids) / prefill_seconds)
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            out = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                 max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens,
+                                 do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        total = time.perf_counter() - start
+        new_tokens = out.shape[-1] - len(ids)
+        if new_tokens > 1 and total > prefill_seconds:
+            decode.append((new_tokens - 1) / (total - prefill_seconds))
+    return {"prefill_tokens_per_sec": summarize(prefill), "decode_tokens_per_sec": summarize(decode)}
+
+
+def bench_translation(samples, batch_size):
+    single = []
+    html = []
+    for sample in samples:
+        start = time.perf_counter()
+        html.append(Model_Using.translate_and_generate_html(dict(sample)))
+        single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    Model_Using.translate_batch([dict(sample) for sample in samples], batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    valid = sum(1 for h in html if isinstance(h, str) and not h.startswith("Error"))
+    return {
+        "per_slide_seconds": summarize(single),
+        "batch_seconds_per_slide": batch_seconds / max(len(samples), 1),
+        "valid_outputs": valid,
+    }
+
+
+def bench_rendering(samples, folder):
+    # Rendering is measured on HTML built from the source text, so it does
+    # not depend on the model producing valid JSON
+    html_slides = [
+        Model_Using.build_html({"translated": f'<div dir="rtl">{s["en"].replace(chr(10), "<br>")}</div>', "explaining": ""})
+        for s in samples
+    ]
+    per_slide = []
+    ok = True
+    for i, html in enumerate(html_slides):
+        start = time.perf_counter()
+        ok = render_pdf_from_html_strings(html, os.path.join(folder, f"slide_{i}.pdf")) and ok
+        per_slide.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    ok = render_pdf_document(html_slides, os.path.join(folder, "deck.pdf"), toc=True) and ok
+    document_seconds = time.perf_counter() - start
+    return {
+        "renderer": "weasyprint" if Processing_utils.HTML is not None else "wkhtmltopdf",
+        "succeeded": bool(ok),
+        "per_slide_seconds": summarize(per_slide),
+        "document_seconds": document_seconds,
+    }
+
+################################################
+#main
+################################################
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def walk(new, old, prefix=""):
+        for key, value in new.items():
+            name = f"{prefix}{key}"
+            if isinstance(value, dict) and isinstance(old.get(key), dict):
+                walk(value, old[key], name + ".")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(old.get(key), (int, float)) and old[key]:
+                change = (value - old[key]) / old[key] * 100
+                print(f"{name:60s} {old[key]:12.4f} -> {value:12.4f} ({change:+.1f}%)")
+
+    for section in ("stages", "memory"):
+        walk(results[section], baseline.get(section, {}), section + ".")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=8, help="samples of full_json2.json to translate")
+    parser.add_argument("--decks", type=int, default=3)
+    parser.add_argument("--slides-per-deck", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--real", action="store_true", help="benchmark the configured model instead of the tiny one")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    with open(DATA_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    random.Random(args.seed).shuffle(data)
+    samples = data[:args.samples]
+
+    # Every run must hit the model, not a cache filled by an earlier run
+    Translation_Cache.ENABLED = False
+    Translation_Memory.ENABLED = False
+    Model_Using.GENERATION_PARAMS["max_new_tokens"] = args.max_new_tokens
+
+    if not args.real:
+        Model_Using.set_model(*build_tiny_model([d["en"] for d in data]))
+    load_start = time.perf_counter()
+    Model_Using.get_model()
+    load_seconds = time.perf_counter() - load_start
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+    with tempfile.TemporaryDirectory() as folder:
+        deck_paths = make_decks(data, folder, args.decks, args.slides_per_deck)
+        stages = {
+            "extraction": bench_extraction(deck_paths),
+            "tokens": bench_tokens_per_sec(samples[:3], args.max_new_tokens),
+            "translation": bench_translation(samples, args.batch_size),
+            "rendering": bench_rendering(samples, folder),
+            "decks": bench_decks(deck_paths, args.batch_size),
+        }
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": "real" if args.real else "tiny-random-qwen2",
+        "device": Model_Using.device,
+        "settings": vars(args),
+        "model_load_seconds": load_seconds,
+        "stages": stages,
+        "memory": {
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_vram_mb": torch.cuda.max_memory_allocated() / 2 ** 20 if torch.cuda.is_available() else None,
+        },
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    print(f"Results written to {args.out}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Full vs compact system prompt benchmark.
+
+Runs the same samples of full_json2.json with the long multi-rule
+system_instruction and with the one-line compact prompt (adapters
+registered with "|compact", see Adapter_Registry.py) and compares prompt
+length, prefill time, KV cache / peak memory and how many answers are
+valid JSON with one <br> segment per input line.
+
+The tiny random model of bench_pipeline.py is the default, so only the
+prompt-size numbers mean anything there; its single adapter slot is
+registered as compact for the second run. With --real, the full prompt runs
+on the default adapter and the compact prompt on --compact-adapter, which
+must be registered as a compact adapter (trained in Lora_Finetune.ipynb).
+
+    python benchmarks/bench_prompt.py --out prompt_results.json
+    python benchmarks/bench_prompt.py --real --compact-adapter 0.5B_compact
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from bench_pipeline import DATA_PATH, build_tiny_model, summarize, peak_rss_mb, git_commit
+from Model_Processing import Model_Using, Translation_Cache, Translation_Memory, Glossary, Adapter_Registry
+from Model_Processing.Response_utils import split_translated
+
+################################################
+#measurements
+################################################
+
+def cache_megabytes(past):
+    if hasattr(past, "layers"):
+        tensors = [t for layer in past.layers for t in (layer.keys, layer.values) if t is not None]
+    else:
+        tensors = [t for layer in past for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors) / 2 ** 20
+
+
+def bench_prefill(samples, adapter):
+    """Whole-prompt forward pass per sample, without the system prompt KV cache."""
+    tokenizer, model = Model_Using.get_model()
+    prompt_tokens, seconds, cache_mb = [], [], []
+    with Model_Using.use_adapter(adapter):
+        for sample in samples:
+            ids = Model_Using.prompt_ids(tokenizer, Model_Using.build_messages(sample, adapter))
+            input_ids = torch.tensor([ids], device=Model_Using.device)
+            start = time.perf_counter()
+            with torch.no_grad():
+                out = model(input_ids=input_ids, use_cache=True)
+            seconds.append(time.perf_counter() - start)
+            prompt_tokens.append(len(ids))
+            cache_mb.append(cache_megabytes(out.past_key_values))
+    return {
+        "prompt_tokens": summarize(prompt_tokens),
+        "prefill_seconds": summarize(seconds),
+        "kv_cache_mb": summarize(cache_mb),
+    }
+
+
+def bench_outputs(samples, adapter, batch_size):
+    """Generate for every sample and count the answers the pipeline can use."""
+    tokenizer, _ = Model_Using.get_model()
+    prompts = [Model_Using.prompt_ids(tokenizer, Model_Using.build_messages(sample, adapter)) for sample in samples]
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    decoded = Model_Using._generate_all(prompts, batch_size, adapter)
+    seconds = time.perf_counter() - start
+
+    valid_json, aligned = 0, 0
+    for sample, qwen_res in zip(samples, decoded):
+        result = Model_Using.parse_response(qwen_res)
+        if not isinstance(result, dict) or "translated" not in result:
+            continue
+        valid_json += 1
+        if len(split_translated(result["translated"])) == len(sample["en"].split("\n")):
+            aligned += 1
+    return {
+        "seconds_per_slide": seconds / max(len(samples), 1),
+        "valid_json": valid_json,
+        "aligned_lines": aligned,
+        "valid_rate": valid_json / max(len(samples), 1),
+        "peak_vram_mb": torch.cuda.max_memory_allocated() / 2 ** 20 if torch.cuda.is_available() else None,
+    }
+
+
+def run_mode(samples, adapter, batch_size):
+    return {
+        "adapter": adapter,
+        "prompt_mode": Adapter_Registry.prompt_mode(adapter),
+        "system_prompt_chars": len(Model_Using.active_system_instruction(adapter)),
+        "prefill": bench_prefill(samples, adapter),
+        "outputs": bench_outputs(samples, adapter, batch_size),
+    }
+
+################################################
+#main
+################################################
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--real", action="store_true", help="benchmark the configured model instead of the tiny one")
+    parser.add_argument("--compact-adapter", help="adapter registered with the compact prompt (required with --real)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="prompt_results.json")
+    args = parser.parse_args()
+
+    with open(DATA_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    random.Random(args.seed).shuffle(data)
+    samples = data[:args.samples]
+
+    # Only the prompt may differ between the two runs
+    Translation_Cache.ENABLED = False
+    Translation_Memory.ENABLED = False
+    Glossary.ENABLED = False
+    Model_Using.GENERATION_PARAMS["max_new_tokens"] = args.max_new_tokens
+    if not args.real:
+        Model_Using.set_model(*build_tiny_model([d["en"] for d in data]))
+    Model_Using.get_model()
+
+    default = Model_Using.DEFAULT_ADAPTER
+    if Adapter_Registry.prompt_mode(default) != "full":
+        parser.error(f"the default adapter '{default}' must use the full prompt")
+    modes = {"full": run_mode(samples, default, args.batch_size)}
+
+    if args.real:
+        compact_adapter = Model_Using.check_adapter(args.compact_adapter) if args.compact_adapter else "Error: --compact-adapter is required with --real"
+        if compact_adapter.startswith("Error:"):
+            parser.error(compact_adapter)
+        if Adapter_Registry.prompt_mode(compact_adapter) != "compact":
+            parser.error(f"adapter '{compact_adapter}' is not registered with |compact in TRANSLATOR_ADAPTERS")
+    else:
+        # The tiny model has one adapter slot; its prompt is switched for the second run
+        compact_adapter = default
+        Adapter_Registry.PROMPT_MODES[default] = "compact"
+    modes["compact"] = run_mode(samples, compact_adapter, args.batch_size)
+
+    full, compact = modes["full"]["prefill"], modes["compact"]["prefill"]
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": "real" if args.real else "tiny-random-qwen2",
+        "device": Model_Using.device,
+        "settings": vars(args),
+        "modes": modes,
+        "compact_vs_full": {
+            "prompt_tokens_saved": full["prompt_tokens"]["mean"] - compact["prompt_tokens"]["mean"],
+            "prefill_speedup": full["prefill_seconds"]["mean"] / compact["prefill_seconds"]["mean"],
+            "kv_cache_mb_saved": full["kv_cache_mb"]["mean"] - compact["kv_cache_mb"]["mean"],
+            "valid_rate_change": modes["compact"]["outputs"]["valid_rate"] - modes["full"]["outputs"]["valid_rate"],
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+
+    for name, mode in modes.items():
+        print(f"{name:>8}: {mode['prefill']['prompt_tokens']['mean']:7.0f} prompt tokens, "
+              f"prefill {mode['prefill']['prefill_seconds']['mean'] * 1000:8.1f} ms, "
+              f"KV cache {mode['prefill']['kv_cache_mb']['mean']:6.2f} MB, "
+              f"valid {mode['outputs']['valid_json']}/{len(samples)} (aligned {mode['outputs']['aligned_lines']})")
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
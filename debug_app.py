@@ -4,7 +4,8 @@ import json
 import time
 # Import your functions individually
 from Processing_utils import validate_input_file, process_single_slide, render_pdf_from_html_strings, generate_unique_output_path
-from Model_Processing.Model_Using import translate_and_generate_html
+from Model_Processing.Model_Using import translate_and_generate_html, warm_up, is_model_loaded, LOAD_STATS
+from Metrics_utils import start_trace
 
 st.set_page_config(page_title="Pipeline Debugger", layout="wide")
 st.title("🕵️ Pipeline Component Tester")
@@ -16,7 +17,43 @@ slide_number = st.number_input("Slide Number", min_value=1, value=1)
 # Checkbox to skip AI if you just want to test PDF generation quickly
 skip_ai = st.checkbox("⚡ Skip AI Model (Use Dummy Data)", value=False)
 
+# Only pay for the model load when the AI step will actually run
+if not skip_ai:
+    warm_up()
+if is_model_loaded():
+    st.caption(f"Model loaded on `{LOAD_STATS['device']}` in {LOAD_STATS['load_seconds']:.1f}s")
+
+def show_waterfall(spans):
+    # One bar per span, offset from the start of the test run
+    st.subheader("⏱️ Stage Timings")
+    if not spans:
+        st.write("No spans recorded.")
+        return
+    spans = sorted(spans, key=lambda s: s["offset"])
+    total = max(s["offset"] + s["seconds"] for s in spans) or 1e-9
+    rows = []
+    for s in spans:
+        left = 100 * s["offset"] / total
+        width = max(100 * s["seconds"] / total, 0.5)
+        extra = ", ".join(f"{k}={v}" for k, v in s.items() if k not in ("name", "offset", "seconds"))
+        rows.append(
+            f"<div style='display:flex;align-items:center;margin:2px 0'>"
+            f"<div style='width:140px;font-family:monospace'>{s['name']}</div>"
+            f"<div style='flex:1;position:relative;height:16px;background:#eee'>"
+            f"<div style='position:absolute;left:{left:.2f}%;width:{width:.2f}%;height:100%;background:#2980b9'></div></div>"
+            f"<div style='width:320px;padding-left:8px;font-family:monospace'>{s['seconds'] * 1000:.1f} ms {extra}</div>"
+            f"</div>"
+        )
+    st.markdown("".join(rows), unsafe_allow_html=True)
+
+
+def stop(spans):
+    show_waterfall(spans)
+    st.stop()
+
+
 if uploaded_file and st.button("▶️ Start Step-by-Step Test"):
+    spans = start_trace()
     
     # Save file locally first (Streamlit requirement)
     os.makedirs("inputs", exist_ok=True)
@@ -37,7 +74,7 @@ if uploaded_file and st.button("▶️ Start Step-by-Step Test"):
     
     if not status:
         st.error("❌ Validation Failed. Stopping here.")
-        st.stop()
+        stop(spans)
     else:
         st.success("✅ Validation Passed")
 
@@ -50,7 +87,7 @@ if uploaded_file and st.button("▶️ Start Step-by-Step Test"):
     
     if not output_path:
         st.error("❌ Path Generation Failed.")
-        st.stop()
+        stop(spans)
     else:
         st.success("✅ Path Generated")
 
@@ -65,7 +102,7 @@ if uploaded_file and st.button("▶️ Start Step-by-Step Test"):
     
     if slides_text == 0:
         st.error("❌ Extraction Failed (Returned 0). Slide might be empty.")
-        st.stop()
+        stop(spans)
     
     # Try to pretty print the JSON
     try:
@@ -99,7 +136,7 @@ if uploaded_file and st.button("▶️ Start Step-by-Step Test"):
     if not html_slides or "Error" in html_slides:
         st.error("❌ Translation Failed or returned Error.")
         st.error(f"Raw Output: {html_slides}")
-        st.stop()
+        stop(spans)
     else:
         st.success("✅ Translation Complete (HTML String Received)")
         
@@ -133,4 +170,6 @@ if uploaded_file and st.button("▶️ Start Step-by-Step Test"):
         else:
             st.error("❌ Function returned True, but file was not found on disk.")
     else:
-        st.error("❌ PDF Generation Failed (WeasyPrint error).")
\ No newline at end of file
+        st.error("❌ PDF Generation Failed (WeasyPrint error).")
+
+    show_waterfall(spans)
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+
+# Translation jobs live in a small SQLite database. The Streamlit app only
+# submits jobs and polls them; one worker process holds the model and runs
+# the workflow stages, so the model is loaded once however many sessions
+# are open.
+JOBS_DB = os.environ.get("TRANSLATOR_JOBS_DB", os.path.join("jobs", "jobs.sqlite3"))
+# The worker stamps its row and its running job every HEARTBEAT_SECONDS; one
+# that has been silent for STALE_SECONDS is taken for dead (liveness is not
+# checked with os.kill: signal 0 is CTRL_C_EVENT on Windows, and a zombie
+# child still passes it on Linux)
+HEARTBEAT_SECONDS = float(os.environ.get("TRANSLATOR_WORKER_HEARTBEAT", "5"))
+STALE_SECONDS = float(os.environ.get("TRANSLATOR_WORKER_STALE", "60"))
+# workers.pid while ensure_worker's process is still starting up
+_STARTING = -1
+
+
+def _connect():
+    directory = os.path.dirname(JOBS_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id TEXT PRIMARY KEY,"
+        " kind TEXT NOT NULL,"
+        " file_path TEXT NOT NULL,"
+        " slide_number INTEGER,"
+        " status TEXT NOT NULL,"
+        " stage TEXT,"
+        " progress REAL NOT NULL DEFAULT 0,"
+        " detail TEXT,"
+        " result_path TEXT,"
+        " error TEXT,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL)"
+    )
+    # Databases created before these columns get them added
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+    for name, kind in (("adapter", "TEXT"), ("worker_pid", "INTEGER"), ("heartbeat", "REAL")):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+    # A single row: the worker that owns the queue and its last heartbeat
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS workers ("
+        " id INTEGER PRIMARY KEY CHECK (id = 1),"
+        " pid INTEGER NOT NULL,"
+        " heartbeat REAL NOT NULL)"
+    )
+    return conn
+
+################################################
+#UI side: submit and poll
+################################################
+
+def submit_job(file_path, slide_number=None, adapter=None):
+    """Queue a slide job (slide_number given) or a whole-deck job, return its id.
+
+    adapter names one of Adapter_Registry.ADAPTERS (None = the default).
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, file_path, slide_number, adapter, status, created_at, updated_at)"
+        " VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+        (job_id, "deck" if slide_number is None else "slide", file_path, slide_number, adapter, now, now),
+    )
+    conn.close()
+    return job_id
+
+
+def get_job(job_id):
+    conn = _connect()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job["detail"] = json.loads(job["detail"]) if job["detail"] else None
+    return job
+
+
+def queue_position(job_id):
+    conn = _connect()
+    row = conn.execute(
+        "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+        " AND created_at < (SELECT created_at FROM jobs WHERE id = ?)",
+        (job_id,),
+    ).fetchone()
+    conn.close()
+    return row[0]
+
+################################################
+#worker side
+################################################
+
+def _acquire_worker(conn, pid):
+    """Make pid the queue's only worker; False if another live worker owns it.
+
+    Jobs left 'running' by a worker whose heartbeat went stale are queued again.
+    """
+    # BEGIN IMMEDIATE takes the write lock, so two starting workers cannot both win
+    conn.execute("BEGIN IMMEDIATE")
+    now = time.time()
+    row = conn.execute("SELECT pid, heartbeat FROM workers WHERE id = 1").fetchone()
+    if row is not None and row["pid"] not in (pid, _STARTING) and row["heartbeat"] > now - STALE_SECONDS:
+        conn.execute("ROLLBACK")
+        return False
+    conn.execute("INSERT OR REPLACE INTO workers (id, pid, heartbeat) VALUES (1, ?, ?)", (pid, now))
+    conn.execute(
+        "UPDATE jobs SET status = 'queued', worker_pid = NULL, updated_at = ?"
+        " WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+        (now, now - STALE_SECONDS),
+    )
+    conn.execute("COMMIT")
+    return True
+
+
+def _heartbeat_loop(pid, lost):
+    # Own connection: sqlite3 connections stay on the thread that made them
+    conn = _connect()
+    while not lost.is_set():
+        now = time.time()
+        try:
+            owned = conn.execute("UPDATE workers SET heartbeat = ? WHERE id = 1 AND pid = ?", (now, pid)).rowcount
+            if not owned:
+                # Silent for too long and replaced by another worker
+                lost.set()
+                break
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND worker_pid = ?", (now, pid))
+        except sqlite3.OperationalError as e:
+            # Busy database: the next beat tries again
+            print(f"Worker heartbeat failed: {e}")
+        lost.wait(HEARTBEAT_SECONDS)
+    conn.close()
+
+
+def _claim_next(conn, pid):
+    # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same job
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+    if row is not None:
+        now = time.time()
+        conn.execute("UPDATE jobs SET status = 'running', worker_pid = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                     (pid, now, now, row["id"]))
+    conn.execute("COMMIT")
+    return dict(row) if row is not None else None
+
+
+def _update(conn, job_id, **fields):
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", list(fields.values()) + [job_id])
+
+
+def _run_job(conn, job):
+    import workflow
+
+    last_write = [0.0]
+
+    def progress(stage, fraction, detail=None):
+        # Partial outputs arrive per token; write them at most a few times a second
+        now = time.time()
+        if stage == "translate" and detail is not None and now - last_write[0] < 0.5:
+            return
+        last_write[0] = now
+        _update(conn, job["id"], stage=stage, progress=fraction,
+                detail=json.dumps(detail, ensure_ascii=False) if detail is not None else None)
+
+    if job["kind"] == "deck":
+        return workflow.process_deck_translation(job["file_path"], progress=progress, adapter=job["adapter"])
+    return workflow.process_translation_pipeline(job["file_path"], job["slide_number"], progress=progress, adapter=job["adapter"])
+
+
+def run_worker(poll_interval=0.5):
+    """Process queued jobs until another worker takes over. Meant to run in its own process."""
+    pid = os.getpid()
+    conn = _connect()
+    # Checked before the model is imported or loaded, so a second worker costs nothing
+    if not _acquire_worker(conn, pid):
+        print("Another worker is already running; exiting")
+        return
+    lost = threading.Event()
+    threading.Thread(target=_heartbeat_loop, args=(pid, lost), name="worker-heartbeat", daemon=True).start()
+
+    from Model_Processing import Model_Using
+    from Metrics_utils import span, start_metrics_server
+
+    if not Model_Using.SERVER_URL:
+        # With TRANSLATOR_SERVER_URL the inference server holds the model, not this worker
+        Model_Using.warm_up(background=False)
+    # /metrics for the worker's spans and counters when TRANSLATOR_METRICS_PORT is set
+    start_metrics_server()
+
+    while not lost.is_set():
+        job = _claim_next(conn, pid)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        try:
+            with span("job", job_id=job["id"]):
+                result_path = _run_job(conn, job)
+            if not result_path:
+                _update(conn, job["id"], status="failed", error="Invalid file, slide number or slide text")
+            else:
+                _update(conn, job["id"], status="done", stage="done", progress=1.0, result_path=result_path)
+        except Exception as e:
+            _update(conn, job["id"], status="failed", error=str(e))
+
+
+def ensure_worker():
+    """Start the worker process unless one is running or starting."""
+    conn = _connect()
+    # Check and reserve in one write transaction, so two sessions never both spawn
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT heartbeat FROM workers WHERE id = 1").fetchone()
+    if row is not None and row["heartbeat"] > time.time() - STALE_SECONDS:
+        conn.execute("ROLLBACK")
+        conn.close()
+        return False
+    # The new process takes the reservation over in _acquire_worker
+    conn.execute("INSERT OR REPLACE INTO workers (id, pid, heartbeat) VALUES (1, ?, ?)", (_STARTING, time.time()))
+    conn.execute("COMMIT")
+    conn.close()
+    process = multiprocessing.get_context("spawn").Process(target=run_worker, name="translation-worker", daemon=False)
+    process.start()
+    return True
+
+
+if __name__ == "__main__":
+    # A worker can also be started by hand: python job_queue.py
+    run_worker()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Processing_utils import clean_text
+from Model_Processing import Translation_Cache
+
+PARAMS = {"max_new_tokens": 512}
+
+
+def test_trailing_number_is_part_of_the_key():
+    # The slide numbers 4 and 5 are cleaned away; the years must stay in the key
+    first = clean_text("Python was first released in 1991\n4")
+    second = clean_text("Python was first released in 2008\n5")
+    assert first != second
+    assert Translation_Cache.make_key(first, "adapter", PARAMS) != Translation_Cache.make_key(second, "adapter", PARAMS)
+
+
+def test_whitespace_does_not_change_the_key():
+    key = Translation_Cache.make_key("Intro to  Python\nVariables", "adapter", PARAMS)
+    assert Translation_Cache.make_key("Intro to Python \nVariables", "adapter", PARAMS) == key
+    assert Translation_Cache.make_key("Intro to Python Variables", "adapter", PARAMS) != key
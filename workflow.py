@@ -1,10 +1,25 @@
-from Process_funcs import validate_input_file ,process_single_slide, render_pdf_from_html_strings , generate_unique_output_path
-from Model_Processing.Model_Using import translate_and_generate_html
+import os
+import time
+import threading
+import contextvars
+from queue import Queue, Empty
+from contextlib import contextmanager
+from Processing_utils import validate_input_file ,process_single_slide, render_pdf_from_html_strings , generate_unique_output_path, get_deck_index, render_pdf_document, layout_slide, write_laid_out_document
+from Model_Processing.Model_Using import translate_stream, translate_batch
+from Metrics_utils import log_event, register_stats
 
 
-def process_translation_pipeline(file_path: str,slide_nubmer:int) -> str:
+def _report(progress, stage, fraction, detail=None):
+    if progress is not None:
+        progress(stage, fraction, detail)
+
+
+def process_translation_pipeline(file_path: str,slide_nubmer:int, progress=None, adapter=None) -> str:
+    # progress(stage, fraction, detail) is called as the pipeline moves on;
+    # during translation detail is the partial model output from translate_stream
 
     # 0. Validate input
+    _report(progress, "validate", 0.0)
     status=validate_input_file(file_path,slide_nubmer)
     #>>>>return 1 or 0
     if not (status):
@@ -14,21 +29,201 @@ def process_translation_pipeline(file_path: str,slide_nubmer:int) -> str:
     #>>>>return a new path for pdf file we will create
 
     # 2. Extract text from PPTX
+    _report(progress, "extract", 0.1)
     slides_text = process_single_slide(file_path,slide_nubmer)
     #extract all text from slides as [slide_x_text_as_json({key:value)}]
     if (slides_text == 0):
         return False
 
     # 3. Translate text and generate HTML per slide (in-memory)
-    html_slides = translate_and_generate_html(slides_text)
+    _report(progress, "translate", 0.2)
+    html_slides = None
+    for update in translate_stream(slides_text, adapter=adapter):
+        if update["done"]:
+            html_slides = update["html"]
+        else:
+            _report(progress, "translate", 0.2, update)
     #it will return the same structure of the slides_text put it will include an html text as a translated for extract text
+    if html_slides.startswith("Error"):
+        raise RuntimeError(html_slides)
 
     # 4. Render PDF directly from HTML strings
-    render_pdf_from_html_strings(html_slides, output_pdf_path)
-    #convert all html text we have into pdf file and save it in the path we generate 
+    _report(progress, "render", 0.9)
+    if not render_pdf_from_html_strings(html_slides, output_pdf_path):
+        raise RuntimeError("PDF rendering failed")
+    #convert all html text we have into pdf file and save it in the path we generate
+
+    _report(progress, "done", 1.0, {"html": html_slides})
+    return output_pdf_path
+
+
+################################################
+#whole-deck pipeline
+################################################
+
+# extract -> translate -> render run at the same time, connected by bounded
+# queues: python-pptx parsing and PDF layout of finished slides overlap with
+# generation of the next batch, and a slow stage holds the faster ones back
+# instead of piling up slides in memory.
+PIPELINE_QUEUE_SIZE = int(os.environ.get("TRANSLATOR_PIPELINE_QUEUE", "16"))
+
+# Per-stage busy time and utilisation of the last deck
+PIPELINE_STATS = {}
+register_stats("pipeline", PIPELINE_STATS)
+
+_END = object()
+
+
+class _Stage:
+    """Busy / waiting time of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.error = None
+
+    def get(self, queue):
+        start = time.perf_counter()
+        item = queue.get()
+        self.waiting += time.perf_counter() - start
+        return item
+
+    def put(self, queue, item):
+        # Blocked on a full queue counts as waiting too (the next stage is the bottleneck)
+        start = time.perf_counter()
+        queue.put(item)
+        self.waiting += time.perf_counter() - start
+
+    @contextmanager
+    def working(self, items=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.busy += time.perf_counter() - start
+            self.items += items
+
+    def report(self, wall):
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "waiting_seconds": round(self.waiting, 3),
+            "utilisation": round(self.busy / wall, 3) if wall > 0 else 0.0,
+        }
+
+
+def _extract_stage(stage, file_path, slide_numbers, out_queue):
+    try:
+        for n in slide_numbers:
+            with stage.working():
+                slide_text = process_single_slide(file_path, n)
+            stage.put(out_queue, (n, slide_text))
+    except Exception as e:
+        stage.error = e
+    finally:
+        stage.put(out_queue, _END)
+
+
+def _translate_stage(stage, in_queue, out_queue, batch_size, adapter):
+    ended = False
+    while not ended:
+        # Wait for one slide, then take whatever else is already extracted:
+        # the model starts as soon as there is work instead of waiting for a full batch
+        batch = [stage.get(in_queue)]
+        while len(batch) < batch_size and batch[-1] is not _END:
+            try:
+                batch.append(in_queue.get_nowait())
+            except Empty:
+                break
+        if batch[-1] is _END:
+            batch.pop()
+            ended = True
+        if not batch or stage.error is not None:
+            # After a failure the remaining slides are drained so extraction is never blocked
+            continue
+        try:
+            with stage.working(len(batch)):
+                html_slides = translate_batch([slide_text for _, slide_text in batch], batch_size=batch_size, adapter=adapter)
+        except Exception as e:
+            stage.error = e
+            continue
+        for (n, _), html in zip(batch, html_slides):
+            stage.put(out_queue, (n, html))
+    stage.put(out_queue, _END)
+
+
+def process_deck_translation(file_path: str, batch_size: int = 8, progress=None, adapter=None) -> str:
+    # Whole deck: every slide with enough text is translated in batches and
+    # the results are rendered into one PDF with a table of contents.
+    # Rendering runs on the calling thread, so progress() is only ever called from it.
+    _report(progress, "extract", 0.0)
+    deck = get_deck_index(file_path)
+    slide_numbers = list(range(1, deck.slide_count + 1))
+    titles = [f"Slide {n}" for n in slide_numbers]
+
+    stages = {name: _Stage(name) for name in ("extract", "translate", "render")}
+    texts, html_slides = Queue(maxsize=PIPELINE_QUEUE_SIZE), Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    workers = [
+        # copy_context keeps the worker spans in the caller's trace (debug_app)
+        threading.Thread(target=contextvars.copy_context().run, name="deck-extract",
+                         args=(_extract_stage, stages["extract"], file_path, slide_numbers, texts), daemon=True),
+        threading.Thread(target=contextvars.copy_context().run, name="deck-translate",
+                         args=(_translate_stage, stages["translate"], texts, html_slides, batch_size, adapter), daemon=True),
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    render = stages["render"]
+    results = [None] * len(slide_numbers)
+    layouts = [None] * len(slide_numbers)
+    done = 0
+    while True:
+        item = render.get(html_slides)
+        if item is _END:
+            break
+        n, html = item
+        with render.working():
+            results[n - 1] = html
+            if render.error is None:
+                try:
+                    layouts[n - 1] = layout_slide(html, n - 1, titles[n - 1])
+                except Exception as e:
+                    render.error = e
+        done += 1
+        _report(progress, "translate", 0.1 + 0.8 * done / max(len(slide_numbers), 1))
+    for worker in workers:
+        worker.join()
+
+    for stage in stages.values():
+        if stage.error is not None and stage.name != "render":
+            raise RuntimeError(f"{stage.name} stage failed: {stage.error}")
+
+    _report(progress, "render", 0.9)
+    output_pdf_path = generate_unique_output_path(file_path, "all")
+    with render.working(0):
+        if any(layouts) and render.error is None:
+            ok = write_laid_out_document(layouts, output_pdf_path, titles, toc=True)
+        else:
+            # No WeasyPrint (wkhtmltopdf) or a layout failed: render the whole document at the end
+            ok = render_pdf_document(results, output_pdf_path, titles=titles, toc=True)
+    if not ok:
+        raise RuntimeError("PDF rendering failed")
+
+    wall = time.perf_counter() - start
+    report = {name: stage.report(wall) for name, stage in stages.items()}
+    PIPELINE_STATS.clear()
+    PIPELINE_STATS["wall_seconds"] = wall
+    for name, stage_report in report.items():
+        PIPELINE_STATS[f"{name}_utilisation"] = stage_report["utilisation"]
+    log_event("pipeline.deck", slides=len(slide_numbers), wall_seconds=round(wall, 3), stages=report)
 
+    # html: one entry per slide (HTML or "Error: ...") for app.py's preview
+    _report(progress, "done", 1.0, {"html": results, "stages": report, "wall_seconds": round(wall, 3)})
     return output_pdf_path
 
 
 
-#run by --streamlit run app.py --server.fileWatcherType none 
\ No newline at end of file
+#run by --streamlit run app.py --server.fileWatcherType none